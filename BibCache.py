@@ -0,0 +1,123 @@
+# BibCache class
+#   - an on-disk cache of parsed bibliography files
+#   - a cache file holds the abbreviations and entries recorded while
+#     parsing, see BibTeX.BibRecorder, which are replayed on a hit
+#   - enabled by setting the environment variable BIBCACHE to a directory
+
+# Copyright (c) 2007, Peter Corke
+#
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * The name of the copyright holder may not be used to endorse or 
+#	promote products derived from this software without specific prior 
+#	written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS ``AS IS''
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS AND CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+import string;
+import marshal;
+import hashlib;
+import tempfile;
+import os;
+import os.path;
+import sys;
+
+class BibCache:
+
+	magic = "BIBC";
+	version = 2;	# change when the format of the recording changes
+
+	def __init__(self, dir, verbose=False):
+		self.dir = dir;
+		self.verbose = verbose;
+		self.hits = 0;
+		self.misses = 0;
+
+	# the name of the cache file for a source file
+	def cacheName(self, fileName):
+		path = os.path.realpath(fileName);
+		return os.path.join(self.dir, hashlib.sha1(path).hexdigest() + ".bibc");
+
+	# the identity of a source file: resolved path, size, modification time
+	# and a hash of the contents s
+	def identity(self, fileName, s):
+		st = os.stat(fileName);
+		return (os.path.realpath(fileName), st.st_size, st.st_mtime,
+			hashlib.sha1(s).hexdigest());
+
+	# return the recording for the source file with contents s, or None
+	# if it is not in the cache, or the cache file is stale or corrupt
+	def load(self, fileName, s):
+		ops = None;
+		try:
+			fp = open(self.cacheName(fileName), "rb");
+			try:
+				data = fp.read();
+			finally:
+				fp.close();
+			if data[:len(self.magic)] == self.magic:
+				version, ident, ops = marshal.loads(data[len(self.magic):]);
+				if version != self.version or ident != self.identity(fileName, s):
+					ops = None;
+		except (EnvironmentError, EOFError, ValueError, TypeError):
+			ops = None;
+
+		if ops == None:
+			self.misses += 1;
+			what = "miss";
+		else:
+			self.hits += 1;
+			what = "hit";
+		if self.verbose:
+			print >> sys.stderr, "cache %s for %s" % (what, fileName);
+		return ops;
+
+	# save the recording for the source file with contents s.  The cache
+	# file is written under a temporary name and renamed into place so
+	# that other processes never read a partly written file.
+	def store(self, fileName, s, ops):
+		data = self.magic + marshal.dumps( (self.version, self.identity(fileName, s), ops), 2);
+		tmp = None;
+		try:
+			if not os.path.isdir(self.dir):
+				os.makedirs(self.dir);
+			fd, tmp = tempfile.mkstemp(".tmp", "", self.dir);
+			fp = os.fdopen(fd, "wb");
+			try:
+				fp.write(data);
+			finally:
+				fp.close();
+			os.rename(tmp, self.cacheName(fileName));
+		except EnvironmentError, err:
+			# the cache is only an optimization
+			if self.verbose:
+				print >> sys.stderr, "cache not written for %s: %s" % (fileName, err);
+			if tmp and os.path.exists(tmp):
+				os.remove(tmp);
+
+	def report(self, file=sys.stderr):
+		file.write( "cache: %d hits, %d misses\n" % (self.hits, self.misses) );
+
+# return the cache named by the environment, or None if there is none.  If
+# BIBCACHEVERBOSE is set each hit and miss is reported.
+def fromEnvironment():
+	dir = os.environ.get('BIBCACHE');
+	if not dir:
+		return None;
+	return BibCache(os.path.expanduser(dir), bool(os.environ.get('BIBCACHEVERBOSE')));
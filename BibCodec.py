@@ -0,0 +1,289 @@
+# codecs for compressed bibliography files
+#   - a compressed file is recognised by its first bytes and decompressed a
+#     block at a time as it is read, see reader
+#   - a file is written compressed if its name ends with the suffix of a
+#     codec, see writer
+#   - gzip and bzip2 always, xz with the lzma module, or else the xz
+#     program for files
+#
+
+# Copyright (c) 2007, Peter Corke
+#
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * The name of the copyright holder may not be used to endorse or 
+#	promote products derived from this software without specific prior 
+#	written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS ``AS IS''
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS AND CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+
+import zlib;
+import bz2;
+import gzip;
+import subprocess;
+import string;
+try:
+	import lzma;
+except ImportError:
+	try:
+		from backports import lzma;
+	except ImportError:
+		lzma = None;
+
+blocksize = 1<<18;	# compressed bytes read at a time
+
+# read a compressed file through a decompressor, a block at a time.  Streams
+# that follow each other, as from concatenated files, are all read.
+class Decompressed:
+
+	def __init__(self, fp, codec, head=""):
+		self.fp = fp;
+		self.codec = codec;
+		self.decompressor = codec.decompressor();
+		self.head = head;	# bytes already read from fp
+		self.pieces = [];
+		self.size = 0;
+		self.eof = False;
+		if hasattr(fp, 'name'):
+			self.name = fp.name;
+
+	def decompress(self, data):
+		out = [];
+		while data:
+			try:
+				out.append(self.decompressor.decompress(data));
+			except EOFError:
+				# bz2 and lzma refuse data after the end of a stream,
+				# which is all of it if the stream ended with the
+				# last block
+				self.decompressor = self.codec.decompressor();
+				continue;
+			data = self.decompressor.unused_data;
+			if data:
+				self.decompressor = self.codec.decompressor();
+		return string.join(out, '');
+
+	# if the last stream has been read to its end, rather than cut short
+	def finished(self):
+		d = self.decompressor;
+		if hasattr(d, 'eof'):
+			# lzma
+			return d.eof;
+		if hasattr(d, 'copy'):
+			# zlib, anything after the end is left unused
+			d = d.copy();
+			try:
+				d.decompress('\0');
+			except zlib.error:
+				return False;
+			return d.unused_data != '';
+		# bz2, refuses anything after the end
+		try:
+			d.decompress('');
+		except EOFError:
+			return True;
+		return False;
+
+	# return up to n decompressed bytes, or all the rest if n is negative
+	def read(self, n=-1):
+		while not self.eof and (n < 0 or self.size < n):
+			data = self.head or self.fp.read(blocksize);
+			self.head = "";
+			if not data:
+				self.eof = True;
+				if not self.finished():
+					raise IOError, "%s: %s data is truncated" % (getattr(self, 'name', 'input'), self.codec.name);
+				break;
+			data = self.decompress(data);
+			self.pieces.append(data);
+			self.size += len(data);
+		s = string.join(self.pieces, '');
+		if n < 0 or n >= len(s):
+			self.pieces = [];
+			self.size = 0;
+			return s;
+		self.pieces = [s[n:]];
+		self.size = len(s) - n;
+		return s[:n];
+
+	def close(self):
+		self.fp.close();
+
+# read a stream that could not be rewound, with the first bytes read again
+class Prefixed:
+
+	def __init__(self, fp, head):
+		self.fp = fp;
+		self.head = head;
+		if hasattr(fp, 'name'):
+			self.name = fp.name;
+
+	def read(self, n=-1):
+		head = self.head;
+		self.head = "";
+		if n < 0:
+			return head + self.fp.read();
+		if len(head) >= n:
+			self.head = head[n:];
+			return head[:n];
+		return head + self.fp.read(n - len(head));
+
+	def close(self):
+		self.fp.close();
+
+# read the output of a program that decompresses a file
+class Piped:
+
+	def __init__(self, fp, args):
+		self.fp = fp;
+		self.process = subprocess.Popen(args, stdin=fp, stdout=subprocess.PIPE);
+		self.program = args[0];
+		self.name = fp.name;
+
+	def read(self, n=-1):
+		s = self.process.stdout.read(n);
+		if n < 0 or not s:
+			status = self.process.wait();
+			if status:
+				raise IOError, "%s: %s exited with %d" % (self.name, self.program, status);
+		return s;
+
+	def close(self):
+		self.process.stdout.close();
+		self.process.wait();
+		self.fp.close();
+
+# write through a program that compresses to a file
+class PipedWriter:
+
+	def __init__(self, fileName, args):
+		self.out = open(fileName, "wb");
+		self.process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=self.out);
+		self.program = args[0];
+		self.name = fileName;
+
+	def write(self, s):
+		self.process.stdin.write(s);
+
+	def close(self):
+		self.process.stdin.close();
+		status = self.process.wait();
+		self.out.close();
+		if status:
+			raise IOError, "%s: %s exited with %d" % (self.name, self.program, status);
+
+class Codec:
+
+	def __init__(self, name, magic, suffix, decompressor, compressor, program):
+		self.name = name;
+		self.magic = magic;
+		self.suffix = suffix;
+		self.decompressor = decompressor;	# or None
+		self.compressor = compressor;		# opens a file, or None
+		self.program = program;			# used if they are None
+
+	# return a file reading fp decompressed, head is the bytes already
+	# read from it
+	def reader(self, fp, head, seekable):
+		if self.decompressor:
+			return Decompressed(fp, self, head);
+		if not (seekable and hasattr(fp, 'fileno')):
+			raise IOError, "%s: cannot read %s data without the lzma module" % (getattr(fp, 'name', 'input'), self.name);
+		return Piped(fp, [self.program, "-dc"]);
+
+	# return a file writing to fileName compressed
+	def writer(self, fileName):
+		if self.compressor:
+			return self.compressor(fileName);
+		return PipedWriter(fileName, [self.program, "-c"]);
+
+if lzma:
+	xzDecompressor = lzma.LZMADecompressor;
+	xzCompressor = lambda f: lzma.LZMAFile(f, "w");
+else:
+	xzDecompressor = None;
+	xzCompressor = None;
+
+codecs = [
+	Codec('gzip', '\x1f\x8b', '.gz', lambda: zlib.decompressobj(16 + zlib.MAX_WBITS), lambda f: gzip.GzipFile(f, "wb"), 'gzip'),
+	Codec('bzip2', 'BZh', '.bz2', bz2.BZ2Decompressor, lambda f: bz2.BZ2File(f, "w"), 'bzip2'),
+	Codec('xz', '\xfd7zXZ\x00', '.xz', xzDecompressor, xzCompressor, 'xz'),
+];
+
+# return a file reading fp, decompressed if it starts with the magic bytes of
+# a codec.  An uncompressed file that can be rewound is returned as it is.
+def reader(fp):
+	try:
+		pos = fp.tell();
+		head = fp.read(6);
+		fp.seek(pos);
+		seekable = True;
+	except (AttributeError, IOError):
+		head = fp.read(6);
+		seekable = False;
+	for codec in codecs:
+		if head.startswith(codec.magic):
+			if seekable:
+				head = "";
+			return codec.reader(fp, head, seekable);
+	if seekable:
+		return fp;
+	return Prefixed(fp, head);
+
+# return a file writing to fileName, compressed by the codec of its suffix
+def writer(fileName):
+	for codec in codecs:
+		if fileName.endswith(codec.suffix):
+			return codec.writer(fileName);
+	return open(fileName, "w");
+
+if __name__ == "__main__":
+	import StringIO;
+	import sys;
+
+	# concatenated streams are read whole whatever the block size,
+	# including blocks that end exactly where a stream does
+	text = ["@misc{a, title={one}}\n", "@misc{b, title={two}}\n"];
+
+	def gzipped(s):
+		out = StringIO.StringIO();
+		f = gzip.GzipFile(fileobj=out, mode="wb");
+		f.write(s);
+		f.close();
+		return out.getvalue();
+
+	compressors = [('gzip', gzipped), ('bzip2', bz2.compress)];
+	if lzma:
+		compressors.append( ('xz', lzma.compress) );
+	bad = 0;
+	for name, compress in compressors:
+		streams = [compress(t) for t in text];
+		data = string.join(streams, '');
+		# the loop sets the module's blocksize, used by Decompressed
+		for blocksize in (1, 7, len(streams[0]), len(streams[0]) - 1, len(streams[0]) + 1, 1<<18):
+			try:
+				s = reader(StringIO.StringIO(data)).read();
+			except (IOError, EOFError), err:
+				s = err;
+			if s != string.join(text, ''):
+				print "%s, blocksize %d: %r" % (name, blocksize, s);
+				bad += 1;
+	print "%d codecs, %d failures" % (len(compressors), bad);
+	sys.exit(bad > 0);
@@ -0,0 +1,161 @@
+# Columns class
+#   - the entries of a bibliography as columns: arrays of year, month,
+#     reference type, URL flag, number of authors, volume and number, and
+#     the keys and titles as strings packed end to end
+#   - counts, date ranges and orderings over all entries without calling
+#     the methods of each entry
+#
+
+# Copyright (c) 2007, Peter Corke
+#
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * The name of the copyright holder may not be used to endorse or 
+#	promote products derived from this software without specific prior 
+#	written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS ``AS IS''
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS AND CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+import string;
+
+import array;
+import itertools;
+import collections;
+import BibEntry;
+
+# a column of strings, kept end to end in one character array
+class StringColumn:
+
+	def __init__(self):
+		self.data = array.array('c');
+		self.offsets = array.array('l', [0]);
+
+	def append(self, s):
+		self.data.fromstring(s);
+		self.offsets.append(len(self.data));
+
+	def __len__(self):
+		return len(self.offsets) - 1;
+
+	def __getitem__(self, i):
+		return self.data[self.offsets[i]:self.offsets[i+1]].tostring();
+
+	def __iter__(self):
+		for i in xrange(len(self)):
+			yield self[i];
+
+# the smallest and largest values held by an array of each signed type code
+limits = dict( (code, (-1 << (8*array.array(code).itemsize - 1), (1 << (8*array.array(code).itemsize - 1)) - 1)) for code in 'bhil' );
+
+# an integer from a field such as volume or number, or -1 if it has none or
+# it is too large for an array of type code
+def number(s, code='l'):
+	try:
+		n = int(s);
+	except (TypeError, ValueError):
+		return -1;
+	lo, hi = limits[code];
+	if lo <= n <= hi:
+		return n;
+	return -1;
+
+class Columns:
+
+	# the number columns and their array types
+	numeric = (
+		('year', 'i'),
+		('month', 'b'),
+		('type', 'B'),		# index in BibEntry.alltypes
+		('url', 'B'),
+		('authors', 'h'),
+		('volume', 'l'),
+		('number', 'l') );
+
+	# entries is a bibliography, or any iterable of entries, which are not
+	# kept
+	def __init__(self, entries=()):
+		for name, code in self.numeric:
+			setattr(self, name, array.array(code));
+		self.keys = StringColumn();
+		self.titles = StringColumn();
+		self.typecodes = dict( (t, i) for i, t in enumerate(BibEntry.alltypes) );
+		for be in entries:
+			self.append(be);
+
+	def append(self, be):
+		self.year.append(number(be.getYear(), 'i'));
+		self.month.append(number(be.getMonth(), 'b'));
+		self.type.append(self.typecodes[be.getRefType()]);
+		self.url.append(1 if be.getURL() else 0);
+		self.authors.append(number(len(be.getAuthorList()), 'h'));
+		self.volume.append(number(be.getField('Volume'), 'l'));
+		self.number.append(number(be.getField('Number'), 'l'));
+		self.keys.append(be.getKey());
+		self.titles.append(be.getTitle());
+
+	def __len__(self):
+		return len(self.year);
+
+	# the names of the reference types of the entries
+	def types(self):
+		return itertools.imap(BibEntry.alltypes.__getitem__, self.type);
+
+	# return a Counter of the values of the named columns, or of tuples of
+	# their values if there are several, eg. counts('year', 'type')
+	def counts(self, *names):
+		cols = [self.types() if n == 'type' else getattr(self, n) for n in names];
+		if len(cols) == 1:
+			return collections.Counter(cols[0]);
+		return collections.Counter(itertools.izip(*cols));
+
+	# year and month as one number, ordered as the dates are, with an
+	# unknown month before January
+	def dates(self):
+		return array.array('l', [y*16 + m for y, m in itertools.izip(self.year, self.month)]);
+
+	# the date as taken by BibEntry.afterDate and beforeDate, [year] or
+	# [month, year], as a value of dates()
+	def dateValue(self, date):
+		if len(date) == 1:
+			return date[0]*16 - 1;
+		return date[1]*16 + date[0];
+
+	# return a mask of the entries in the date range, as for
+	# BibEntry.afterDate(since) and beforeDate(before)
+	def dateMask(self, since=None, before=None):
+		lo = self.dateValue(since) if since else None;
+		hi = self.dateValue(before) if before else None;
+		dates = self.dates();
+		if lo == None and hi == None:
+			return array.array('B', [1]) * len(dates);
+		if hi == None:
+			return array.array('B', [d >= lo for d in dates]);
+		if lo == None:
+			return array.array('B', [d < hi for d in dates]);
+		return array.array('B', [lo <= d < hi for d in dates]);
+
+	# the indices of the entries where a mask is set
+	def where(self, mask):
+		return list(itertools.compress(xrange(len(mask)), mask));
+
+	# the indices of the entries in date order, newest first unless reverse
+	# is set, entries with the same date in their original order, as bibsort
+	def order(self, reverse=False):
+		dates = self.dates();
+		return sorted(xrange(len(dates)), key=dates.__getitem__, reverse=not reverse);
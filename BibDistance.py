@@ -0,0 +1,192 @@
+# Edit distance functions
+#   - the Levenshtein distance between two strings, the number of single
+#     character insertions, deletions and substitutions that turn one
+#     into the other
+#   - bounded versions, for when all that matters is whether the distance
+#     is within a threshold, that give up as soon as it is exceeded
+
+# Copyright (c) 2007, Peter Corke
+#
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * The name of the copyright holder may not be used to endorse or 
+#	promote products derived from this software without specific prior 
+#	written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS ``AS IS''
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS AND CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+import string;
+
+# the distance between strings a and b
+def distance(a, b):
+	prev = range(len(b)+1);
+	for i in range(1, len(a)+1):
+		cur = [i] * (len(b)+1);
+		ca = a[i-1];
+		for j in range(1, len(b)+1):
+			if ca == b[j-1]:
+				cur[j] = prev[j-1];
+			else:
+				cur[j] = min(prev[j-1], prev[j], cur[j-1]) + 1;
+		prev = cur;
+	return prev[-1];
+
+# the distance between strings a and b if it is at most k, otherwise k+1.
+#
+# Strings whose lengths differ by more than k are rejected at once.  Only
+# the cells of the table within k of the diagonal are computed, since a
+# path through any other cell costs more than k, and the computation stops
+# at the first row with no cell within k.
+def bounded(a, b, k):
+	if len(a) > len(b):
+		a, b = b, a;
+	n = len(a);
+	m = len(b);
+	if m - n > k:
+		return k+1;
+	big = k+1;
+	prev = range(min(m, k)+1) + [big] * (m-min(m, k));
+	for i in range(1, n+1):
+		cur = [big] * (m+1);
+		if i <= k:
+			cur[0] = i;
+		lo = max(1, i-k);
+		hi = min(m, i+k);
+		ca = a[i-1];
+		best = cur[lo-1];
+		for j in range(lo, hi+1):
+			if ca == b[j-1]:
+				d = prev[j-1];
+			else:
+				d = min(prev[j-1], prev[j], cur[j-1]) + 1;
+				if d > big:
+					d = big;
+			cur[j] = d;
+			if d < best:
+				best = d;
+		if best > k:
+			return big;
+		prev = cur;
+	return prev[m];
+
+# true if the distance between strings a and b is at most k
+def within(a, b, k):
+	return bounded(a, b, k) <= k;
+
+# the list of distances between string a and each of the strings in l.  If
+# k is given a distance greater than k is returned as k+1.
+#
+# This uses the bit-parallel algorithm of Myers, as formulated by Hyyro,
+# in which a column of the table is held in the bits of two integers and
+# computed in a handful of operations.  The bit masks for the characters
+# of a are computed once for the whole list.
+def distances(a, l, k=None):
+	n = len(a);
+	peq = {};
+	for i, c in enumerate(a):
+		peq[c] = peq.get(c, 0) | (1 << i);
+	top = 1 << max(n-1, 0);
+	full = (1 << n) - 1;
+
+	dl = [];
+	for b in l:
+		m = len(b);
+		if k != None and abs(n - m) > k:
+			dl.append(k+1);
+			continue;
+		if n == 0:
+			d = m;
+		else:
+			pv = full;
+			mv = 0;
+			d = n;
+			for j, c in enumerate(b):
+				eq = peq.get(c, 0);
+				xv = eq | mv;
+				xh = (((eq & pv) + pv) ^ pv) | eq;
+				ph = (mv | ~(xh | pv)) & full;
+				mh = pv & xh;
+				if ph & top:
+					d += 1;
+				elif mh & top:
+					d -= 1;
+				# the remaining characters of b reduce d by at most one each
+				if k != None and d - (m-j-1) > k:
+					break;
+				ph = (ph << 1) | 1;
+				mh = mh << 1;
+				pv = (mh | ~(xv | ph)) & full;
+				mv = ph & xv;
+		if k != None and d > k:
+			d = k+1;
+		dl.append(d);
+	return dl;
+
+# microbenchmarks against the dict-based table previously used by
+# BibEntry.matchTitle and bibgoogle
+if __name__ == "__main__":
+	import random;
+	import timeit;
+
+	def table(a, b):
+		c = {}
+		n = len(a); m = len(b)
+
+		for i in range(0,n+1):
+			c[i,0] = i
+		for j in range(0,m+1):
+			c[0,j] = j
+
+		for i in range(1,n+1):
+			for j in range(1,m+1):
+				x = c[i-1,j]+1
+				y = c[i,j-1]+1
+				if a[i-1] == b[j-1]:
+					z = c[i-1,j-1]
+				else:
+					z = c[i-1,j-1]+1
+				c[i,j] = min(x,y,z)
+		return c[n,m]
+
+	words = "robot vision control visual servo adaptive learning mobile navigation kinematics dynamics planning".split();
+	random.seed(1);
+	def title():
+		return ''.join(random.sample(words, 6));
+	def typo(s):
+		i = random.randrange(len(s));
+		return s[:i] + s[i+1:];
+	a = title();
+	near = typo(a);
+	far = title();
+	many = [title() for i in range(100)] + [near];
+
+	def bench(name, f, n):
+		t = min(timeit.repeat(f, number=n, repeat=3)) / n;
+		print "%-40s %10.1f us" % (name, t * 1e6);
+
+	print "title length %d" % len(a);
+	bench("table, near", lambda: table(a, near), 20);
+	bench("distance, near", lambda: distance(a, near), 50);
+	bench("bounded k=2, near", lambda: bounded(a, near, 2), 500);
+	bench("table, far", lambda: table(a, far), 20);
+	bench("bounded k=2, far", lambda: bounded(a, far, 2), 500);
+	bench("table, 1 vs 101", lambda: [table(a, b) for b in many], 1);
+	bench("bounded k=4, 1 vs 101", lambda: [bounded(a, b, 4) for b in many], 10);
+	bench("distances k=4, 1 vs 101", lambda: distances(a, many, 4), 10);
+	bench("distances, 1 vs 101", lambda: distances(a, many), 10);
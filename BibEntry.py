@@ -37,23 +37,156 @@
 import sys;
 import string;
 import re;
+import hashlib;
+import BibDistance;
+import BibNames;
 
 #BadValue = "Bad value";
 #BadField = "Bad field";
 #BadRefType = "Bad reference type";
 
-class BibEntry:
-	fieldDict = {};
+# a field value that is only computed when it is first read, see
+# BibEntry.lookup.  There can be one per field, so subclasses should use
+# __slots__.  Subclasses define value(), which returns the value.
+class Deferred(object):
+	__slots__ = ();
+
+	# replace this, the value of field i of the entry be, by its value, and
+	# return it
+	def resolve(self, be, i):
+		v = be.values[i] = self.value();
+		return v;
+
+# the tuples of field names that entries have, so that entries with the same
+# fields in the same order share one
+layouts = {};
+
+# the fields of an entry as a dictionary, for code that reads and writes
+# them that way.  Iterates in the order the fields were set.
+class FieldView(object):
+	__slots__ = ('entry',);
+
+	def __init__(self, be):
+		self.entry = be;
+
+	def __contains__(self, field):
+		return field in self.entry.fields;
+
+	def __getitem__(self, field):
+		if field not in self.entry.fields:
+			raise KeyError, field;
+		return self.entry.lookup(field);
+
+	def __setitem__(self, field, value):
+		self.entry.store(field, value);
+
+	def __iter__(self):
+		return iter(self.entry.fields);
+
+	def __len__(self):
+		return len(self.entry.fields);
+
+	def get(self, field, default=None):
+		if field in self.entry.fields:
+			return self.entry.lookup(field);
+		return default;
+
+	def keys(self):
+		return list(self.entry.fields);
+
+	def values(self):
+		return [self.entry.lookup(k) for k in self.entry.fields];
+
+	def items(self):
+		return [(k, self.entry.lookup(k)) for k in self.entry.fields];
+
+	def iteritems(self):
+		for k in self.entry.fields:
+			yield (k, self.entry.lookup(k));
+
+class BibEntry(object):
+	# fields holds the names of the fields that are set, interned and
+	# shared through layouts, and values their values in the same order.
+	# The year, month and reference type are kept ready for comparison.
+	# raw is the text the entry was parsed from, if the bibliography keeps
+	# it, until the entry is changed.
+	__slots__ = ('key', 'reftype', 'bibliography', 'year', 'month', 'fields', 'values', 'raw');
 	verbose = 0;
-	bibliography = {};
 
 	def __init__(self, key, bib):
 		self.key = key;
-		self.fieldDict = {};
+		self.reftype = None;
 		self.bibliography = bib;
+		self.year = -1;
+		self.month = -1;
+		self.fields = ();
+		self.values = [];
+		self.raw = None;
 		if BibEntry.verbose:
 			print >> sys.stderr, "New entry ", key;
 
+	# the fields as a dictionary, see FieldView
+	@property
+	def fieldDict(self):
+		return FieldView(self);
+
+	# make this entry share the key and fields of another, for subclasses
+	# that present entries in other ways
+	def share(self, be):
+		for a in BibEntry.__slots__:
+			setattr(self, a, getattr(be, a));
+
+	# return the value of a field, named as in allfields, or None if it is
+	# not set.  A Deferred value is replaced by its value.
+	def lookup(self, field):
+		if field not in self.fields:
+			return None;
+		i = self.fields.index(field);
+		v = self.values[i];
+		if isinstance(v, Deferred):
+			v = v.resolve(self, i);
+		return v;
+
+	# return an MD5 digest of the type, key, field values and interpreted
+	# year and month of the entry, it changes whenever any of them does.  A
+	# month name is kept only as its ordinal, not as a field value.  Each
+	# item is fed to the digest tagged with its kind and length, so that
+	# entries with the same contents have the same digest, in any run.
+	def digest(self):
+		h = hashlib.md5();
+
+		def put(x):
+			if isinstance(x, tuple):
+				h.update("t%d\0" % len(x));
+				for y in x:
+					put(y);
+			elif x == None:
+				h.update("n\0");
+			elif isinstance(x, (int, long)):
+				h.update("i%d\0" % x);
+			else:
+				if not isinstance(x, str):
+					x = repr(x);
+				h.update("s%d\0" % len(x));
+				h.update(x);
+
+		for i in range(len(self.values)):
+			if isinstance(self.values[i], Deferred):
+				self.values[i].resolve(self, i);
+		put( (self.reftype, self.key, self.fields, tuple(self.values), self.getYear(), self.getMonth()) );
+		return h.digest();
+
+	# set the value of a field, named as in allfields, without interpreting
+	# it.  The entry no longer matches its text.
+	def store(self, field, value):
+		self.raw = None;
+		if field in self.fields:
+			self.values[self.fields.index(field)] = value;
+		else:
+			fields = self.fields + (intern(field),);
+			self.fields = layouts.setdefault(fields, fields);
+			self.values.append(value);
+
 	def __repr__(self):
 		str = '"' + self.getTitle() + '"; ';
 		try:
@@ -83,13 +216,11 @@ class BibEntry:
 
 	def display(self, fp=sys.stdout):
 		print >> fp, "%12s: %s" % ("CiteKey", self.key)
-		for k in self.fieldDict:
-			if k[0] == '_':
-				continue;
+		for k in self.fields:
 			if k == 'Author':
 				print >> fp, "%12s: %s" % (k, self.getAuthors())
 			else:
-				print >> fp, "%12s: %s" % (k, self.fieldDict[k])
+				print >> fp, "%12s: %s" % (k, self.lookup(k))
 
 	def __getitem__(self, i):
 		if type(i) is str:
@@ -101,7 +232,7 @@ class BibEntry:
 
 
 	def check(self):
-		keys = self.fieldDict.keys();
+		keys = self.fields;
 		missing = [];
 		reftype = self.getRefType();
 		if not (reftype in alltypes):
@@ -121,11 +252,7 @@ class BibEntry:
 	def getField(self, field):
 		#print >> sys.stderr, field
 		#print >> sys.stderr, self.fieldDict[field]
-		field = field.capitalize();
-		if field in self.fieldDict:
-			return self.fieldDict[field]
-		else:
-			return None;
+		return self.lookup(field.capitalize());
 
 	def getRefType(self):
 		return self.reftype;
@@ -134,8 +261,8 @@ class BibEntry:
 		return self.getRefType().lower() == rt.lower();
 
 	def getTitle(self):
-		if 'Title' in self.fieldDict:
-			title = self.fieldDict['Title'];
+		title = self.lookup('Title');
+		if title != None:
 			title = re.sub(r"""[{}]""", "", title);
 			title = title.strip('.,\'"');
 			return title;
@@ -143,21 +270,20 @@ class BibEntry:
 			return "";
 
 	def getURL(self):
-		if 'Url' in self.fieldDict:
-			url = self.fieldDict['Url'];
-			return url;
+		if 'Url' in self.fields:
+			return self.lookup('Url');
 		else:
 			return "";
 
 	def getAuthorList(self):
-		if 'Author' in self.fieldDict:
-			return self.fieldDict['Author'];
+		if 'Author' in self.fields:
+			return self.lookup('Author');
 		else:
-			return [];
+			return ();
 
 	def getAuthors(self):
-		if 'Author' in self.fieldDict:
-			l = self.fieldDict['Author'];
+		if 'Author' in self.fields:
+			l = self.lookup('Author');
 			if len(l) == 1:
 				return l[0];
 			elif len(l) == 2:
@@ -168,36 +294,14 @@ class BibEntry:
 			return "";
 
 
+	# return (surname, initial) of an author, see BibNames
 	def surname(self, author):
-		# remove LaTeX accents
-		def chg(mo): return mo.group(mo.lastindex);
-		re_accent = re.compile(r'''\\[.'`^"~=uvHcdb]\{(.)\}|\t\{(..)\}''');
-		author = re_accent.sub(chg, author)
-
-		# "surname, first names"
-		m = re.search(r"""^([^,]*),(.*)""", author);
-		if m:
-			#print >> sys.stderr, m.group(1), m.group(2)
-			#return m.group(1) + "," + m.group(2).lstrip()[0];
-			return [m.group(1), m.group(2).lstrip()[0]];
-			#return m.group(1);
-
-		# "first names surname"
-
-		# take the last component after dot or space
-		#m = re.search(r"""([a-zA-Z][a-zA-Z-]*)$""", author);
-		m = re.search(r"""(.*?)([^\. \t]*)$""", author);
-		if m:
-			#print >> sys.stderr, author, ":", m.group(2), "|",  m.group(1)
-			return [m.group(2), m.group(1)[0]];
-			#return m.group(2) + "," + m.group(1)[0];
-
-		return "";
+		return BibNames.parser.surname(author);
 
 	def getAuthorsSurnameList(self):			
-		if 'Author' in self.fieldDict:
-			l = self.fieldDict['Author'];
-			return map(self.surname, l);
+		if 'Author' in self.fields:
+			l = self.lookup('Author');
+			return map(BibNames.parser.surname, l);
 
 	def getAuthorsSurname(self):
 		l = self.getAuthorsSurnameList();
@@ -230,9 +334,9 @@ class BibEntry:
 	# return initial dot sunrname
 
 	def getEditorsSurnameList(self):			
-		if 'Editor' in self.fieldDict:
-			l = self.fieldDict['Editor'];
-			return map(self.surname, l);
+		if 'Editor' in self.fields:
+			l = self.lookup('Editor');
+			return map(BibNames.parser.surname, l);
 			
 	def getEditorsNames(self):
 		l = self.getEditorsSurnameList();
@@ -249,26 +353,26 @@ class BibEntry:
 			return "";
 
 	def getBooktitle(self):
-		if 'Booktitle' in self.fieldDict:
-			return  self.fieldDict['Booktitle'];
+		if 'Booktitle' in self.fields:
+			return self.lookup('Booktitle');
 		else:
 			return "";
 
 	def getVolume(self):
-		if 'Volume' in self.fieldDict:
-			return self.fieldDict['Volume'];
+		if 'Volume' in self.fields:
+			return self.lookup('Volume');
 		else:
 			return -1;
 
 	def getNumber(self):
-		if 'Number' in self.fieldDict:
-			return self.fieldDict['Number'];
+		if 'Number' in self.fields:
+			return self.lookup('Number');
 		else:
 			return -1;
 
 	def getPage(self):
-		if 'Pages' in self.fieldDict:
-			return self.fieldDict['Pages'];
+		if 'Pages' in self.fields:
+			return self.lookup('Pages');
 		else:
 			return "";
 
@@ -305,18 +409,18 @@ class BibEntry:
 			else:
 				return False;
 
+	# the year and month are None while the field is still to be
+	# interpreted, see BibTeX.Pending
 	def getYear(self):
-		if '_year' in self.fieldDict:
-			return self.fieldDict['_year'];
-		else:
-			return -1;
+		if self.year == None:
+			self.lookup('Year');
+		return self.year;
 
 	# return month ordinal in range 1 to 12
 	def getMonth(self):
-		if '_month' in self.fieldDict:
-			return self.fieldDict['_month'];
-		else:
-			return -1;
+		if self.month == None:
+			self.lookup('Month');
+		return self.month;
 
 	monthdict = {
 		'january' : 1,
@@ -362,50 +466,50 @@ class BibEntry:
 		value = string.lower(value);
 		if not (value in alltypes):
 			raise AttributeError, "bad reference type [%s]" % self.getKey();
-		self.reftype = value;
-		self.fieldDict['Type'] = value;
+		self.reftype = intern(value);
+		self.store('Type', self.reftype);
 
 	def setField(self, key, value):
 		key = key.capitalize();
 		if not (key in allfields):
 			raise AttributeError, "bad field <%s> [%s]" % (key, self.getKey());
 		if key == 'Year':
-			self.fieldDict[key] = value;
+			self.store(key, value);
 
 			# remove all text like "to appear", just leave the digits
 			year = filter(lambda c : c.isdigit(), value);
 			try:
-				self.fieldDict['_year'] = int(year);
+				self.year = int(year);
 			except:
 				if value.find('appear') > -1:
 					sys.stderr.write("[%s] no year specified, continuing\n" % self.getKey());
-					self.fieldDict['_year'] = 0;
+					self.year = 0;
 				else:
-					self.fieldDict['_year'] = -1;
+					self.year = -1;
 					raise AttributeError, "[%s] bad year <%s>" % (self.getKey(), value);
 		elif key == 'Month':
 			# the Month entry has the original string from the file if it is of
 			# nonstandard form, else is None.
-			# the hidden entry _month has the ordinal number
-			self.fieldDict[key] = value;
+			# the month attribute has the ordinal number
+			self.store(key, value);
 			#print >> sys.stderr, "Month = <%s>" % value;
 			month = mogrify(value);
 			for monthname in self.monthdict:
 				# handle month abbreviations, eg. nov in november
 				if monthname.find(month) >= 0:
-					self.fieldDict['_month'] = self.monthdict[monthname];
+					self.month = self.monthdict[monthname];
 					#print >> sys.stderr, "_month 1 %d" % self.monthdict[monthname];
-					self.fieldDict[key] = None;
+					self.store(key, None);
 						
 					return;
 				# handle extraneous like november in 'november 12-13'
 				if month.find(monthname) >= 0:
-					self.fieldDict['_month'] = self.monthdict[monthname];
+					self.month = self.monthdict[monthname];
 					#print >> sys.stderr, "_month 2 %d" % self.monthdict[monthname];
 					return;
 			raise AttributeError, "bad month [%s]" % self.getKey();
 		else:
-			self.fieldDict[key] = value;
+			self.store(key, value);
 		#print >> sys.stderr, "<%s> := <%s>\n" % (key, value)
 
 
@@ -416,37 +520,30 @@ class BibEntry:
 
 	def search(self, field, str, caseSens=0):
 		field = string.capitalize(field);
+		if caseSens == 0:
+			pattern = re.compile(str, re.IGNORECASE);
+		else:
+			pattern = re.compile(str);
 
 		if field.lower() == 'all':
-			for be in self:
-				for k in self.fieldDict:
-					if k[0] == '_':
-						continue;
-					s = self.fieldDict[k];
-					if isinstance(s, list):
-						s = ' '.join(s);
-					if s:
-						if caseSens == 0:
-							m = re.search(str, s, re.IGNORECASE);
-						else:
-							m = re.search(str, s);
-						if m:
-							return True;
+			for i in range(len(self.values)):
+				s = self.values[i];
+				if isinstance(s, Deferred):
+					s = s.resolve(self, i);
+				if isinstance(s, tuple):
+					s = ' '.join(s);
+				if s and pattern.search(s):
+					return True;
 				
 		else:
 			# silently ignore search field if not present
-			if not(field in self.fieldDict):
+			if not(field in self.fields):
 				return False;
-			s = self.fieldDict[field];
-			if isinstance(s, list):
+			s = self.lookup(field);
+			if isinstance(s, tuple):
 				s = ' '.join(s);
-			if s:
-				if caseSens == 0:
-					m = re.search(str, s, re.IGNORECASE);
-				else:
-					m = re.search(str, s);
-				if m:
-					return True;
+			if s and pattern.search(s):
+				return True;
 
 		return 0;
 
@@ -503,30 +600,8 @@ class BibEntry:
 		return 1;
 
 	def matchTitle(self, be, dthresh):
-		# Levenstein distance between two strings
-		def distance(a,b):
-		    c = {}
-		    n = len(a); m = len(b)
-
-		    for i in range(0,n+1):
-			c[i,0] = i
-		    for j in range(0,m+1):
-			c[0,j] = j
-			
-		    for i in range(1,n+1):
-			for j in range(1,m+1):
-			    x = c[i-1,j]+1
-			    y = c[i,j-1]+1
-			    if a[i-1] == b[j-1]:
-				z = c[i-1,j-1]
-			    else:
-				z = c[i-1,j-1]+1
-			    c[i,j] = min(x,y,z)
-		    return c[n,m]
-
-		d = distance( mogrify(self.getTitle()), mogrify(be.getTitle()) );
-
-		return d <= dthresh;
+		# Levenstein distance between the two titles, no more than dthresh
+		return BibDistance.within( mogrify(self.getTitle()), mogrify(be.getTitle()), dthresh );
 
 	def matchType(self, be):
 		return self.getRefType() == be.getRefType();
@@ -0,0 +1,437 @@
+# MatchIndex class
+#   - an index of bibliography entries used to find the candidate
+#     duplicates of an entry without comparing it with every entry
+#   - see BibEntry.match
+#
+# TitleIndex class
+#   - a locality sensitive hash of entry titles, used to find clusters of
+#     entries with similar titles and authors whatever their other fields
+#
+# TextIndex class
+#   - an inverted index of the words in each field of the entries, used
+#     by Bibliography.search
+#
+# DateIndex class
+#   - the entries sorted by date, used by Bibliography.dateRange
+
+# Copyright (c) 2007, Peter Corke
+#
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * The name of the copyright holder may not be used to endorse or 
+#	promote products derived from this software without specific prior 
+#	written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS ``AS IS''
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS AND CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+import string;
+import re;
+import random;
+import array;
+import bisect;
+import BibEntry;
+import BibDistance;
+
+class MatchIndex:
+
+	# BibEntry.match only succeeds if the reference types and the number
+	# of authors are the same, so entries are kept in buckets keyed on
+	# those.  It also compares year, month, volume and number for articles,
+	# and first page, but a value that is missing matches anything, see
+	# BibEntry.fmatch.  These are the dimensions of the index, and a
+	# missing value is None.
+	#
+	# The first author's surname would be more selective, but it is not
+	# safe to block on: authors are compared fragment by fragment, so
+	# "Smith, John" matches "Smith John", whose surname is "John".
+
+	def __init__(self):
+		self.entries = [];	# entries in order of insertion
+		self.values = [];	# the dimension values of each entry
+		self.buckets = {};	# (reftype, nauthors) -> Bucket
+
+	def __len__(self):
+		return len(self.entries);
+
+	# the bucket key and the tuple of dimension values of an entry
+	def keys(self, be):
+
+		def value(n):
+			# as fmatch, only a positive value is compared
+			if n > 0:
+				return n;
+			return None;
+
+		key = (be.getRefType(), len(be.getAuthorList()));
+		if be.isRefType("Article"):
+			volume = value(be.getVolume());
+			number = value(be.getNumber());
+		else:
+			volume = number = None;
+		page = be.getPage();
+		if page:
+			page = re.findall("([0-9.]+)", page);
+		if page:
+			page = page[0];
+		else:
+			page = None;
+		return key, (value(be.getYear()), value(be.getMonth()), volume, number, page);
+
+	def insert(self, be):
+		key, values = self.keys(be);
+		i = len(self.entries);
+		self.entries.append(be);
+		self.values.append(values);
+		bucket = self.buckets.get(key);
+		if bucket == None:
+			bucket = self.buckets[key] = Bucket(len(values));
+		bucket.insert(i, values);
+
+	# return the entries that might match be, in order of insertion
+	def candidates(self, be):
+		key, values = self.keys(be);
+		bucket = self.buckets.get(key);
+		if bucket == None:
+			return [];
+		l = [];
+		for i in bucket.lookup(values):
+			for v, u in zip(values, self.values[i]):
+				if v != u and v != None and u != None:
+					break;
+			else:
+				l.append(self.entries[i]);
+		return l;
+
+	# return the first entry inserted that matches be, or None, the same
+	# as comparing be with every entry in order
+	def match(self, be, dthresh=2):
+		for ub in self.candidates(be):
+			if be.match(ub, dthresh=dthresh):
+				return ub;
+		return None;
+
+# the entries of a MatchIndex with the same bucket key, as lists of entry
+# numbers in increasing order: all of them, and for each dimension those
+# with each value, and those where it is missing
+class Bucket:
+
+	def __init__(self, n):
+		self.all = [];
+		self.postings = [{} for d in range(n)];
+		self.missing = [[] for d in range(n)];
+
+	def insert(self, i, values):
+		self.all.append(i);
+		for d, v in enumerate(values):
+			if v == None:
+				self.missing[d].append(i);
+			else:
+				self.postings[d].setdefault(v, []).append(i);
+
+	# return, in increasing order, the entry numbers from the shortest
+	# list of possible matches on any one dimension
+	def lookup(self, values):
+		best = self.all;
+		bestlen = len(best);
+		for d, v in enumerate(values):
+			if v == None:
+				continue;
+			same = self.postings[d].get(v, []);
+			n = len(same) + len(self.missing[d]);
+			if n < bestlen:
+				best = (same, self.missing[d]);
+				bestlen = n;
+		if best is self.all:
+			return best;
+		same, missing = best;
+		if not missing:
+			return same;
+		return sorted(same + missing);
+
+class TitleIndex:
+
+	# Each title, with punctuation and spaces removed by mogrify, is
+	# reduced to its set of q character shingles, and each shingle to a 32
+	# bit hash.  The MinHash signature of the title is, for each of
+	# bands*rows random hash functions, the least value of the function
+	# over the shingle hashes.  Two titles agree on one of these with
+	# probability equal to the Jaccard similarity of their shingle sets,
+	# J.  The signature is cut into bands of rows values, and entries whose
+	# signatures have any band in common are candidate pairs, which
+	# happens with probability 1-(1-J^rows)^bands.  With the default 16
+	# bands of 4 that is over 0.999 for J=0.8, a title of 50 characters
+	# with a couple of typos, and 0.12 for J=0.3.
+	#
+	# Titles share most of their shingles, so the hash function values
+	# for each shingle are computed once and kept, and a signature is the
+	# elementwise minimum of the values of its shingles.  The one
+	# permutation variant of MinHash, which hashes each shingle once into
+	# one of the bins, is cheaper but short titles leave most bins empty,
+	# and filling those from their neighbours makes unrelated titles
+	# collide far more often.
+	#
+	# Only a hash of each band is kept, in a flat array, and the entries
+	# with the same band value are found one band at a time, which keeps
+	# the index small enough for hundreds of thousands of entries.
+
+	def __init__(self, bands=16, rows=4, q=3, seed=1):
+		self.nbands = bands;
+		self.rows = rows;
+		self.q = q;
+		r = random.Random(seed);
+		# hash functions (a*x + b) mod 2^32, with a odd
+		self.coeffs = [(r.getrandbits(32) | 1, r.getrandbits(32)) for i in range(bands*rows)];
+		self.entries = [];
+		self.titles = [];	# mogrified titles of the entries
+		self.hashed = [];	# numbers of the entries with a title
+		self.bands = array.array('l');	# band hashes of those entries
+		self.shingles = {};	# shingle -> hash function values
+
+	def __len__(self):
+		return len(self.entries);
+
+	# the MinHash signature of a mogrified title, or None if it is empty
+	def signature(self, title):
+		if not title:
+			return None;
+		q = self.q;
+		values = [];
+		for s in set([title[i:i+q] for i in range(max(len(title)-q+1, 1))]):
+			v = self.shingles.get(s);
+			if v == None:
+				x = hash(s) & 0xffffffff;
+				v = self.shingles[s] = tuple([(a*x + b) & 0xffffffff for a, b in self.coeffs]);
+			values.append(v);
+		return map(min, zip(*values));
+
+	def insert(self, be):
+		title = BibEntry.mogrify(be.getTitle());
+		sig = self.signature(title);
+		i = len(self.entries);
+		self.entries.append(be);
+		self.titles.append(title);
+		if sig == None:
+			return;
+		rows = self.rows;
+		self.hashed.append(i);
+		self.bands.extend([hash(tuple(sig[b:b+rows])) for b in range(0, len(sig), rows)]);
+
+	# return the clusters of entries that are suspected duplicates: pairs
+	# of candidates whose authors match and whose titles are within dthresh
+	# of each other, see BibEntry.matchAuthorList and matchTitle, joined
+	# into clusters.  Each cluster is a list of entries in order of
+	# insertion, and the clusters are in order of their first entry.
+	def clusters(self, dthresh=2):
+		parent = range(len(self.entries));
+
+		def find(i):
+			while parent[i] != i:
+				parent[i] = parent[parent[i]];
+				i = parent[i];
+			return i;
+
+		entries = self.entries;
+		titles = self.titles;
+		nbands = self.nbands;
+		checked = set();
+		for b in range(nbands):
+			# the entries with the same value of band b, as lists keyed
+			# on the first of them
+			first = {};
+			same = {};
+			bands = self.bands[b::nbands];
+			for n, i in enumerate(self.hashed):
+				j = first.setdefault(bands[n], i);
+				if j != i:
+					same.setdefault(j, [j]).append(i);
+
+			for l in same.itervalues():
+				for n, i in enumerate(l):
+					for j in l[n+1:]:
+						ri = find(i);
+						rj = find(j);
+						if ri == rj or (i, j) in checked:
+							continue;
+						checked.add( (i, j) );
+						# as matchTitle, on the titles already mogrified
+						if BibDistance.within(titles[i], titles[j], dthresh) and entries[i].matchAuthorList(entries[j]):
+							parent[max(ri, rj)] = min(ri, rj);
+
+		clusters = {};
+		for i in range(len(entries)):
+			r = find(i);
+			if r != i:
+				clusters.setdefault(r, [entries[r]]).append(entries[i]);
+		return [clusters[r] for r in sorted(clusters)];
+
+# return the clusters of suspected duplicate entries in a bibliography, see
+# TitleIndex.clusters
+def nearDuplicates(bib, dthresh=2, bands=16, rows=4):
+	index = TitleIndex(bands, rows);
+	for be in bib:
+		index.insert(be);
+	return index.clusters(dthresh);
+
+class TextIndex:
+
+	# The terms of a field value are its runs of letters and digits, folded
+	# to lower case, and for each field the index maps each term to the
+	# numbers of the entries that contain it, in increasing order.  A field
+	# is only indexed when it is first searched, so that a search of one
+	# field costs less than looking at every entry.
+	#
+	# A search is a regular expression search, which matches substrings,
+	# so a query that is a plain string, without regular expression
+	# characters, is looked up by finding the terms that contain each of
+	# its runs of letters and digits.  The entries with all of them are
+	# the candidates.  If the query is just one run and the search is not
+	# case sensitive the candidates are the answer, otherwise they are
+	# checked with BibEntry.search.  Other queries are not answered.
+	#
+	# A run that is itself a term is looked up directly.  The longer terms
+	# that contain it are found in the sorted list of the suffixes of the
+	# terms of the field, as those suffixes that start with the run, so
+	# the vocabulary is never scanned.  The suffixes of a field are sorted
+	# when it is first searched, and again after a new term is added.
+
+	reTerm = re.compile(r"""[A-Za-z0-9]+""");
+	special = '.^$*+?{}[]\\|()';
+
+	def __init__(self):
+		self.entries = [];
+		self.fields = {};	# field -> term -> entry numbers
+		self.suffixes = {};	# field -> sorted suffixes, and their terms
+
+	def __len__(self):
+		return len(self.entries);
+
+	def insert(self, be):
+		i = len(self.entries);
+		self.entries.append(be);
+		for k in self.fields:
+			self.add(k, i, be.fieldDict.get(k));
+
+	# index the value s of field k of entry number i
+	def add(self, k, i, s):
+		if isinstance(s, tuple):
+			s = ' '.join(s);
+		if not isinstance(s, str):
+			return;
+		terms = self.fields[k];
+		for t in set(self.reTerm.findall(s.lower())):
+			l = terms.get(t);
+			if l == None:
+				l = terms[t] = [];
+				self.suffixes.pop(k, None);
+			l.append(i);
+
+	# return the map from terms to entry numbers of a field, indexing the
+	# field first if it has not been searched before
+	def terms(self, k):
+		terms = self.fields.get(k);
+		if terms == None:
+			terms = self.fields[k] = {};
+			for i, be in enumerate(self.entries):
+				self.add(k, i, be.fieldDict.get(k));
+		return terms;
+
+	# return the terms of a field that contain run, other than run itself
+	def containing(self, field, run):
+		sfx = self.suffixes.get(field);
+		if sfx == None:
+			pairs = sorted([(t[n:], t) for t in self.fields[field] for n in range(len(t))]);
+			sfx = self.suffixes[field] = ([p[0] for p in pairs], [p[1] for p in pairs]);
+		suffixes, terms = sfx;
+		found = set();
+		i = bisect.bisect_left(suffixes, run);
+		while i < len(suffixes) and suffixes[i].startswith(run):
+			if terms[i] != run:
+				found.add(terms[i]);
+			i += 1;
+		return found;
+
+	# return the list of entries that match the query as BibEntry.search
+	# does, in order of insertion, or None if the index cannot answer it
+	def search(self, field, str, caseSens=0):
+		for c in str:
+			if c in self.special:
+				return None;
+		runs = self.reTerm.findall(str.lower());
+		if not runs:
+			return None;
+
+		field = field.capitalize();
+		if field == 'All':
+			fields = set();
+			for layout in set([be.fields for be in self.entries]):
+				fields.update(layout);
+		else:
+			fields = [field];
+
+		found = None;
+		for r in runs:
+			# the entries containing any term that contains this run
+			have = set();
+			for f in fields:
+				terms = self.terms(f);
+				have.update(terms.get(r, ()));
+				for t in self.containing(f, r):
+					have.update(terms[t]);
+			if found == None:
+				found = have;
+			else:
+				found &= have;
+
+		entries = [self.entries[i] for i in sorted(found)];
+		if caseSens or runs[0] != str.lower():
+			entries = [be for be in entries if be.search(field, str, caseSens)];
+		return entries;
+
+class DateIndex:
+
+	# the (year, month) of each entry, sorted, with a missing year or month
+	# as -1 like BibEntry.getYear and getMonth, and the entry numbers in the
+	# same order
+
+	def __init__(self, entries):
+		dates = sorted([(be.getYear(), be.getMonth(), i) for i, be in enumerate(entries)]);
+		self.entries = list(entries);
+		self.dates = [(y, m) for y, m, i in dates];
+		self.numbers = [i for y, m, i in dates];
+
+	def __len__(self):
+		return len(self.entries);
+
+	# return the entries that are not before since and are before before,
+	# in their original order, as BibEntry.afterDate and beforeDate.
+	# Dates are [year] or [month, year], or None for no limit.
+	def range(self, since=None, before=None):
+
+		def key(date):
+			if len(date) == 1:
+				return (date[0],);
+			return (date[1], date[0]);
+
+		lo = 0;
+		hi = len(self.dates);
+		if since:
+			lo = bisect.bisect_left(self.dates, key(since));
+		if before:
+			hi = max(lo, bisect.bisect_left(self.dates, key(before)));
+		return [self.entries[i] for i in sorted(self.numbers[lo:hi])];
@@ -0,0 +1,276 @@
+# Lookup class
+#   - fetch web pages in a few worker threads at once, and return the
+#     results in the order they were asked for
+#   - at most rate requests a second to each host, see TokenBucket
+#   - connections are kept open between requests, one per thread and host
+#   - failed requests are retried, waiting twice as long each time
+#
+# LookupCache class
+#   - the results of lookups kept in an SQLite database between runs,
+#     including the lookups that found nothing
+#
+
+# Copyright (c) 2007, Peter Corke
+#
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * The name of the copyright holder may not be used to endorse or 
+#	promote products derived from this software without specific prior 
+#	written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS ``AS IS''
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS AND CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+
+import httplib;
+import socket;
+import string;
+import threading;
+import time;
+import urlparse;
+import multiprocessing.pool;
+import sqlite3;
+import sys;
+
+class FetchError(Exception):
+	pass;
+
+# tokens accumulate at rate a second, up to burst, and each request takes
+# one.  A request that finds none reserves the next and waits for it, so
+# waiting requests are spaced 1/rate apart.
+class TokenBucket:
+
+	def __init__(self, rate, burst=1):
+		self.rate = float(rate);
+		self.burst = burst;
+		self.tokens = float(burst);
+		self.last = time.time();
+		self.lock = threading.Lock();
+
+	# take a token, return the time waited for it
+	def take(self):
+		self.lock.acquire();
+		try:
+			now = time.time();
+			self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate);
+			self.last = now;
+			self.tokens -= 1;
+			wait = max(-self.tokens / self.rate, 0);
+		finally:
+			self.lock.release();
+		if wait > 0:
+			time.sleep(wait);
+		return wait;
+
+class Lookup:
+
+	agent = "pybib";
+	redirects = 5;		# followed for one request
+
+	# URLs are relative to base.  A rate of 0 is unlimited.
+	def __init__(self, base, jobs=4, rate=1.0, burst=1, retries=3, backoff=1.0, timeout=30, agent=None):
+		self.base = base;
+		self.jobs = jobs;
+		self.rate = rate;
+		self.burst = burst;
+		self.retries = retries;
+		self.backoff = backoff;
+		self.timeout = timeout;
+		if agent:
+			self.agent = agent;
+		self.buckets = {};
+		self.local = threading.local();
+		self.lock = threading.Lock();
+		self.requests = 0;
+		self.connections = 0;
+		self.retried = 0;
+		self.failed = 0;
+		self.waited = 0.0;
+
+	def count(self, name, n=1):
+		self.lock.acquire();
+		try:
+			setattr(self, name, getattr(self, name) + n);
+		finally:
+			self.lock.release();
+
+	# wait for the rate limit of a host
+	def limit(self, host):
+		if self.rate <= 0:
+			return;
+		self.lock.acquire();
+		try:
+			bucket = self.buckets.get(host);
+			if bucket == None:
+				bucket = self.buckets[host] = TokenBucket(self.rate, self.burst);
+		finally:
+			self.lock.release();
+		self.count('waited', bucket.take());
+
+	# the connection of this thread to a host
+	def connection(self, scheme, host):
+		if not hasattr(self.local, 'connections'):
+			self.local.connections = {};
+		conn = self.local.connections.get( (scheme, host) );
+		if conn == None:
+			if scheme == 'https':
+				conn = httplib.HTTPSConnection(host, timeout=self.timeout);
+			else:
+				conn = httplib.HTTPConnection(host, timeout=self.timeout);
+			self.local.connections[(scheme, host)] = conn;
+		return conn;
+
+	# return the status and body of a GET of url, following redirects
+	def get(self, url):
+		for i in range(self.redirects + 1):
+			parts = urlparse.urlsplit(url);
+			path = parts.path or '/';
+			if parts.query:
+				path += '?' + parts.query;
+			conn = self.connection(parts.scheme, parts.netloc);
+			while True:
+				# every request sent takes a token, including the
+				# one sent again on a new connection
+				self.limit(parts.netloc);
+				self.count('requests');
+				reused = conn.sock != None;
+				if not reused:
+					self.count('connections');
+				try:
+					conn.request("GET", path, headers={'User-Agent': self.agent});
+					r = conn.getresponse();
+					body = r.read();
+					break;
+				except (socket.error, httplib.HTTPException):
+					conn.close();
+					# the server may have closed an idle connection
+					if not reused:
+						raise;
+			location = r.getheader('location');
+			if r.status in (301, 302, 303, 307) and location:
+				url = urlparse.urljoin(url, location);
+				continue;
+			return r.status, body;
+		self.count('failed');
+		raise FetchError, "%s: too many redirects" % url;
+
+	# return the body of the page at url, relative to base.  Network errors,
+	# and responses that say to try again later, are retried.
+	def fetch(self, url):
+		url = urlparse.urljoin(self.base, url);
+		for attempt in range(self.retries + 1):
+			if attempt > 0:
+				self.count('retried');
+				time.sleep(self.backoff * 2 ** (attempt - 1));
+			try:
+				status, body = self.get(url);
+			except (socket.error, httplib.HTTPException), err:
+				error = str(err) or err.__class__.__name__;
+				continue;
+			if status == 200:
+				return body;
+			error = "HTTP status %d" % status;
+			if not (status == 429 or status >= 500):
+				break;
+		self.count('failed');
+		raise FetchError, "%s: %s" % (url, error);
+
+	# apply func to each of items in jobs threads, and iterate over the
+	# results in the order of items
+	def map(self, func, items):
+		pool = multiprocessing.pool.ThreadPool(self.jobs);
+		try:
+			for r in pool.imap(func, items):
+				yield r;
+		finally:
+			pool.terminate();
+
+	def report(self, file=sys.stderr):
+		file.write( "lookup: %d requests, %d connections, %d retries, %d failed, %.1fs rate limited\n" % (self.requests, self.connections, self.retried, self.failed, self.waited) );
+
+# the URL chosen by a lookup, or None if nothing was found, and the candidate
+# URLs, by query.  Results are used for ttl seconds, or negativeTTL if nothing
+# was found.  At most size results are kept, the least recently used are
+# removed when the cache is closed.
+class LookupCache:
+
+	version = 1;	# change when the format of the table changes
+	batch = 100;	# results stored in one transaction
+
+	def __init__(self, fileName, ttl=30*86400, negativeTTL=7*86400, size=100000):
+		self.ttl = ttl;
+		self.negativeTTL = negativeTTL;
+		self.size = size;
+		self.hits = 0;
+		self.misses = 0;
+		self.pending = 0;
+		self.db = sqlite3.connect(fileName);
+		self.db.text_factory = str;
+		if self.db.execute("pragma user_version").fetchone()[0] != self.version:
+			self.db.execute("drop table if exists lookups");
+			self.db.execute("pragma user_version = %d" % self.version);
+		self.db.execute("""create table if not exists lookups (
+			query text primary key, url text, candidates text,
+			time real, used real)""");
+		self.db.execute("create index if not exists lookupsUsed on lookups (used)");
+		self.db.commit();
+
+	# return (url, candidates) for a query, or None if it is not in the
+	# cache or has expired
+	def get(self, query):
+		row = self.db.execute("select url, candidates, time from lookups where query = ?", (query,)).fetchone();
+		now = time.time();
+		if row != None:
+			url, candidates, when = row;
+			if url == None:
+				ttl = self.negativeTTL;
+			else:
+				ttl = self.ttl;
+			if now - when < ttl:
+				self.hits += 1;
+				self.db.execute("update lookups set used = ? where query = ?", (now, query));
+				self.written();
+				return url, [c for c in candidates.split('\n') if c];
+		self.misses += 1;
+		return None;
+
+	# store the result of a query
+	def put(self, query, url, candidates):
+		now = time.time();
+		self.db.execute("insert or replace into lookups values (?, ?, ?, ?, ?)",
+			(query, url, string.join(candidates, '\n'), now, now));
+		self.written();
+
+	# commit a batch of changes
+	def written(self):
+		self.pending += 1;
+		if self.pending >= self.batch:
+			self.db.commit();
+			self.pending = 0;
+
+	# remove the least recently used results over size, and close
+	def close(self):
+		n = self.db.execute("select count(*) from lookups").fetchone()[0];
+		if n > self.size:
+			self.db.execute("""delete from lookups where query in
+				(select query from lookups order by used limit ?)""", (n - self.size,));
+		self.db.commit();
+		self.db.close();
+
+	def report(self, file=sys.stderr):
+		file.write( "lookup cache: %d hits, %d misses\n" % (self.hits, self.misses) );
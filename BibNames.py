@@ -0,0 +1,99 @@
+# NameParser class
+#   - splits an author's name into surname and initial, after removing
+#     LaTeX accents
+#   - remembers the results for the most recently used names, with counts
+#     of the names found and not found
+#
+
+# Copyright (c) 2007, Peter Corke
+#
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * The name of the copyright holder may not be used to endorse or 
+#	promote products derived from this software without specific prior 
+#	written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS ``AS IS''
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS AND CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+import string;
+import re;
+
+reAccent = re.compile(r'''\\[.'`^"~=uvHcdb]\{(.)\}|\t\{(..)\}''');
+reCommaName = re.compile(r"""^([^,]*),(.*)""");		# surname, first names
+reSpaceName = re.compile(r"""(.*?)([^\. \t]*)$""");	# first names surname
+
+# the letter of a LaTeX accent
+def unaccent(mo):
+	return mo.group(mo.lastindex);
+
+class NameParser:
+
+	# keep the results for up to size names.  They are kept in two
+	# generations of half that many: names used since the current one was
+	# started, and names used during the one before.  A name found in the
+	# older generation moves to the current one, and when the current one
+	# is full it becomes the older one, dropping the names that have not
+	# been used for two generations.  A hit is then just a dict lookup.
+	def __init__(self, size=10000):
+		self.generation = max(size // 2, 1);
+		self.hits = 0;
+		self.misses = 0;
+		self.names = {};	# name -> result, the current generation
+		self.older = {};	# the generation before
+
+	# return (surname, initial, name without accents).  Raises IndexError,
+	# as BibEntry.surname always has, if the name has no first names.
+	def parse(self, author):
+		result = self.names.get(author);
+		if result != None:
+			self.hits += 1;
+			return result;
+		result = self.older.pop(author, None);
+		if result != None:
+			self.hits += 1;
+		else:
+			self.misses += 1;
+			result = self.split(author);
+		if len(self.names) >= self.generation:
+			self.older = self.names;
+			self.names = {};
+		self.names[author] = result;
+		return result;
+
+	def split(self, author):
+		plain = reAccent.sub(unaccent, author);
+		m = reCommaName.search(plain);
+		if m:
+			return (m.group(1), m.group(2).lstrip()[0], plain);
+		m = reSpaceName.search(plain);
+		return (m.group(2), m.group(1)[0], plain);
+
+	# return (surname, initial)
+	def surname(self, author):
+		return self.parse(author)[:2];
+
+	# return the name without LaTeX accents
+	def plain(self, author):
+		return self.parse(author)[2];
+
+	def report(self):
+		return "names: %d hits, %d misses, %d remembered" % (self.hits, self.misses, len(self.names) + len(self.older));
+
+# the parser shared by all entries
+parser = NameParser();
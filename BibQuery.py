@@ -0,0 +1,105 @@
+# Query class
+#   - a query on bibliography entries: reference type, date range, a field
+#     that must be present and a regular expression search of a field
+#   - the tests are made cheapest first, in one pass over the entries
+
+# Copyright (c) 2007, Peter Corke
+#
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * The name of the copyright holder may not be used to endorse or 
+#	promote products derived from this software without specific prior 
+#	written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS ``AS IS''
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS AND CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+import string;
+
+class Query:
+
+	# since and before are dates as taken by BibEntry.afterDate and
+	# beforeDate, [year] or [month, year]
+	def __init__(self, type="all", field="all", str="*", caseSens=0, hasfield=None, since=None, before=None):
+		self.type = type;
+		self.field = field;
+		self.str = str;
+		self.caseSens = caseSens;
+		self.since = since;
+		self.before = before;
+		self.tests = [];	# (cost, name, test) in order of cost
+
+		if string.lower(type) != "all":
+			self.add(lambda be: be.isRefType(type), 1, "type");
+		if since:
+			self.add(lambda be: be.afterDate(since), 2, "date");
+		if before:
+			self.add(lambda be: be.beforeDate(before), 2, "date");
+		if hasfield:
+			self.add(lambda be: be.getField(hasfield), 3, "hasfield");
+		if str != '*':
+			self.add(lambda be: be.search(field, str, caseSens), 10, "search");
+
+	# add a test, a function of an entry that is true if it matches, with a
+	# rough relative cost: 1 for comparing an attribute, 10 for a search
+	def add(self, test, cost, name="test"):
+		self.tests.append( (cost, name, test) );
+		self.tests.sort(key=lambda t: t[0]);
+
+	def __repr__(self):
+		return "Query(%s)" % string.join([t[1] for t in self.tests], ", ");
+
+	def matches(self, be):
+		for cost, name, test in self.tests:
+			if not test(be):
+				return False;
+		return True;
+
+	# iterate over the entries that match
+	def filter(self, entries):
+		for be in entries:
+			if self.matches(be):
+				yield be;
+
+	# return a list of the entries in a bibliography that match, in order.
+	# If there is a date range only the entries in it are looked at, see
+	# Bibliography.dateRange, and if the bibliography has a text index
+	# that can answer the search only the entries it finds, see
+	# BibIndex.TextIndex, whichever are fewer.
+	def select(self, bib):
+		candidates = None;
+		answered = None;
+		if self.since or self.before:
+			candidates = bib.dateRange(self.since, self.before);
+			answered = "date";
+		if self.str != '*' and bib.textIndex != None:
+			found = bib.textIndex.search(self.field, self.str, self.caseSens);
+			if found != None and (candidates == None or len(found) < len(candidates)):
+				candidates = found;
+				answered = "search";
+		if candidates == None:
+			return list(self.filter(bib));
+		tests = [t for t in self.tests if t[1] != answered];
+		result = [];
+		for be in candidates:
+			for cost, name, test in tests:
+				if not test(be):
+					break;
+			else:
+				result.append(be);
+		return result;
@@ -0,0 +1,245 @@
+# RemoteCache class
+#   - local copies of bibliographies named by http or https URLs
+#   - a copy is revalidated with a conditional GET, using the ETag and
+#     Last-Modified header of its download, and only downloaded again if it
+#     has changed
+#   - enabled by setting the environment variable BIBCACHE to a directory,
+#     the copies are kept there beside the parsed files of BibCache
+#
+
+# Copyright (c) 2007, Peter Corke
+#
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * The name of the copyright holder may not be used to endorse or 
+#	promote products derived from this software without specific prior 
+#	written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS ``AS IS''
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS AND CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+
+import urllib2;
+import marshal;
+import hashlib;
+import tempfile;
+import cStringIO;
+import os;
+import os.path;
+import sys;
+
+class RemoteCache:
+
+	def __init__(self, dir, verbose=False):
+		self.dir = dir;
+		self.verbose = verbose;
+		self.downloads = 0;	# full downloads
+		self.unchanged = 0;	# revalidated, not downloaded
+		self.stale = 0;		# used without revalidating, after an error
+		self.bytes = 0;		# downloaded
+
+	# the names of the copy of a URL, and of its validators
+	def cacheName(self, url):
+		name = os.path.join(self.dir, hashlib.sha1(url).hexdigest());
+		return name + ".bib", name + ".val";
+
+	# the validators (ETag, Last-Modified) of the copy of a URL, or None if
+	# there is no copy
+	def validators(self, url):
+		copy, val = self.cacheName(url);
+		try:
+			fp = open(val, "rb");
+			try:
+				saved, etag, modified = marshal.load(fp);
+			finally:
+				fp.close();
+		except (EnvironmentError, EOFError, ValueError, TypeError):
+			return None;
+		if saved != url or not os.path.isfile(copy):
+			return None;
+		return etag, modified;
+
+	# return a file open on the contents of a URL, from the copy if the
+	# server says it has not changed.  If the server cannot be reached, or
+	# fails, an existing copy is used anyway.
+	def open(self, url):
+		copy, val = self.cacheName(url);
+		validators = self.validators(url);
+		request = urllib2.Request(url);
+		if validators:
+			etag, modified = validators;
+			if etag:
+				request.add_header('If-None-Match', etag);
+			if modified:
+				request.add_header('If-Modified-Since', modified);
+		try:
+			response = urllib2.urlopen(request);
+			try:
+				data = response.read();
+				headers = response.info();
+			finally:
+				response.close();
+		except urllib2.HTTPError, err:
+			if validators and err.code == 304:
+				self.unchanged += 1;
+				self.log("unchanged", url);
+				return open(copy, "r");
+			if validators and err.code >= 500:
+				return self.useStale(url, err);
+			raise;
+		except (urllib2.URLError, EnvironmentError), err:
+			if validators:
+				return self.useStale(url, err);
+			raise;
+
+		self.downloads += 1;
+		self.bytes += len(data);
+		self.log("downloaded %d bytes of" % len(data), url);
+		if self.store(url, data, headers.getheader('ETag'), headers.getheader('Last-Modified')):
+			return open(copy, "r");
+		return cStringIO.StringIO(data);
+
+	def useStale(self, url, err):
+		print >> sys.stderr, "%s: %s, using the copy from %s" % (url, err, self.dir);
+		self.stale += 1;
+		return open(self.cacheName(url)[0], "r");
+
+	# save the copy of a URL, then its validators, each under a temporary
+	# name renamed into place, and return True if both were saved
+	def store(self, url, data, etag, modified):
+		copy, val = self.cacheName(url);
+		try:
+			if not os.path.isdir(self.dir):
+				os.makedirs(self.dir);
+			self.replace(copy, data);
+			self.replace(val, marshal.dumps( (url, etag, modified) ));
+		except EnvironmentError, err:
+			# the cache is only an optimization
+			self.log("not saved (%s)," % err, url);
+			return False;
+		return True;
+
+	def replace(self, fileName, data):
+		fd, tmp = tempfile.mkstemp(".tmp", "", self.dir);
+		try:
+			fp = os.fdopen(fd, "wb");
+			try:
+				fp.write(data);
+			finally:
+				fp.close();
+			os.rename(tmp, fileName);
+		except EnvironmentError:
+			if os.path.exists(tmp):
+				os.remove(tmp);
+			raise;
+
+	def log(self, what, url):
+		if self.verbose:
+			print >> sys.stderr, "remote %s %s" % (what, url);
+
+	def report(self, file=sys.stderr):
+		file.write( "remote: %d downloaded (%d bytes), %d unchanged, %d stale\n" % (self.downloads, self.bytes, self.unchanged, self.stale) );
+
+# return the cache named by the environment, or None if there is none.  If
+# BIBCACHEVERBOSE is set each download and revalidation is reported.
+def fromEnvironment():
+	dir = os.environ.get('BIBCACHE');
+	if not dir:
+		return None;
+	return RemoteCache(os.path.expanduser(dir), bool(os.environ.get('BIBCACHEVERBOSE')));
+
+# test the cache against a local server, counting the bytes it sends
+if __name__ == "__main__":
+	import BaseHTTPServer;
+	import threading;
+	import shutil;
+	import Bibliography;
+
+	# the file served, its validators, and the body bytes sent
+	served = {'body': "", 'etag': None, 'modified': None, 'sent': 0};
+
+	class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+		def do_GET(self):
+			etag = self.headers.getheader('If-None-Match');
+			modified = self.headers.getheader('If-Modified-Since');
+			if (etag and etag == served['etag']) or (modified and modified == served['modified']):
+				self.send_response(304);
+				self.end_headers();
+				return;
+			self.send_response(200);
+			self.send_header('Content-Length', str(len(served['body'])));
+			if served['etag']:
+				self.send_header('ETag', served['etag']);
+			if served['modified']:
+				self.send_header('Last-Modified', served['modified']);
+			self.end_headers();
+			self.wfile.write(served['body']);
+			served['sent'] += len(served['body']);
+
+		def log_message(self, *args):
+			pass;
+
+	server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Handler);
+	thread = threading.Thread(target=server.serve_forever);
+	thread.daemon = True;
+	thread.start();
+	dir = tempfile.mkdtemp();
+	Bibliography.Bibliography.remote = RemoteCache(dir);
+
+	# open url and return its contents and the body bytes the server sent
+	def fetch(url):
+		sent = served['sent'];
+		bib = Bibliography.Bibliography();
+		fp = bib.open(url);
+		try:
+			data = fp.read();
+		finally:
+			fp.close();
+		return data, served['sent'] - sent;
+
+	try:
+		for name, validator in [('etag', '"v1"'), ('modified', 'Sat, 17 Oct 2026 10:00:00 GMT')]:
+			url = "http://127.0.0.1:%d/%s.bib" % (server.server_port, name);
+			body = "@article{%s,\n  title = {Served with %s},\n  year = 2026\n}\n" % (name, name);
+			served.update(body=body * 50, etag=None, modified=None);
+			served[name] = validator;
+
+			data, sent = fetch(url);
+			assert data == served['body'] and sent == len(served['body']), "first open downloads the file";
+
+			data, sent = fetch(url);
+			assert data == served['body'] and sent == 0, "second open is revalidated by %s" % name;
+
+			served['body'] = body.replace("2026", "2027") * 50;
+			served[name] = validator.replace("1", "2");
+			data, sent = fetch(url);
+			assert data == served['body'] and sent == len(served['body']), "a changed file is downloaded again";
+			print "%-8s downloaded %d bytes, then 0, then %d when changed" % (name, len(body) * 50, sent);
+
+		server.shutdown();
+		server.server_close();
+		data, sent = fetch(url);
+		assert data == served['body'], "the copy is used when the server is stopped";
+		print "stopped  the copy is used";
+
+		remote = Bibliography.Bibliography.remote;
+		assert (remote.downloads, remote.unchanged, remote.stale) == (4, 2, 1);
+		remote.report(sys.stdout);
+	finally:
+		shutil.rmtree(dir);
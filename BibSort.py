@@ -0,0 +1,136 @@
+# Sorter class
+#   - sort bibliography entries by a key, in memory while they fit in a
+#     memory budget, otherwise by spilling sorted runs to temporary files
+#     and merging them
+#   - or keep just the first few entries in sorted order, with a heap
+#
+
+# Copyright (c) 2007, Peter Corke
+#
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * The name of the copyright holder may not be used to endorse or 
+#	promote products derived from this software without specific prior 
+#	written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS ``AS IS''
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS AND CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+
+import heapq;
+import marshal;
+import tempfile;
+import cStringIO;
+
+# sort keys, functions of an entry.  A key must be a tuple of numbers and
+# strings, so that it can be saved in a run file.
+def newestFirst(be):
+	return (-be.getYear(), -be.getMonth());
+
+def oldestFirst(be):
+	return (be.getYear(), be.getMonth());
+
+# the BibTeX text of an entry, as written by its write method
+def entryText(be):
+	fp = cStringIO.StringIO();
+	be.write(fp);
+	return fp.getvalue();
+
+class Sorter:
+
+	# memory is the budget in bytes for the entries held in memory, limit
+	# the number of entries wanted, or None for all of them
+	def __init__(self, key=newestFirst, memory=128<<20, limit=None, fanin=64):
+		self.key = key;
+		self.memory = memory;
+		self.limit = limit;
+		self.fanin = fanin;	# most run files merged at once
+		self.runs = 0;		# number of run files written
+
+	# iterate over the text of the entries in order of key.  Entries with
+	# the same key stay in the order given, as with list.sort.
+	def sort(self, entries):
+		records = self.records(entries);
+		if self.limit != None:
+			for k, seq, text in heapq.nsmallest(self.limit, records):
+				yield text;
+			return;
+
+		run = [];
+		size = 0;
+		files = [];
+		for r in records:
+			run.append(r);
+			size += len(r[2]) + 200;	# and the tuples and key
+			if size > self.memory:
+				files.append(self.spill(run));
+				run = [];
+				size = 0;
+		run.sort();
+		if not files:
+			for k, seq, text in run:
+				yield text;
+			return;
+
+		if run:
+			files.append(self.spill(run));
+		del run;
+		while len(files) > self.fanin:
+			# merge the oldest runs into one, so few files are open at once
+			group = files[:self.fanin];
+			files = files[self.fanin:] + [self.spillMerged(group)];
+		for k, seq, text in self.merge(files):
+			yield text;
+
+	# (key, sequence number, text) for each entry, the sequence number makes
+	# the sort stable and saves comparing texts
+	def records(self, entries):
+		seq = 0;
+		for be in entries:
+			yield (self.key(be), seq, entryText(be));
+			seq += 1;
+
+	# write a list of records, in order, to a temporary file
+	def spill(self, run):
+		run.sort();
+		fp = tempfile.TemporaryFile(prefix='bibsort');
+		for r in run:
+			marshal.dump(r, fp, 2);
+		fp.seek(0);
+		self.runs += 1;
+		return fp;
+
+	def spillMerged(self, files):
+		fp = tempfile.TemporaryFile(prefix='bibsort');
+		for r in self.merge(files):
+			marshal.dump(r, fp, 2);
+		fp.seek(0);
+		self.runs += 1;
+		return fp;
+
+	# merge the records in run files, closing them as they are used up
+	def merge(self, files):
+		return heapq.merge(*[readRun(fp) for fp in files]);
+
+# iterate over the records in a run file
+def readRun(fp):
+	try:
+		while True:
+			yield marshal.load(fp);
+	except EOFError:
+		fp.close();
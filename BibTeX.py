@@ -35,53 +35,78 @@
 
 import Bibliography;
 import BibEntry;
+import BibCache;
+import BibCodec;
 import string;
 import re;
 import sys;
 import urllib;
+import mmap;
+import os.path;
+import multiprocessing;
+import array;
+import bisect;
+import itertools;
+import collections;
+import time;
 
 class BibTeXEntry(BibEntry.BibEntry):
+	__slots__ = ();
 
-	# write a BibTex format entry
+	# write a BibTex format entry, as it was read if it has not been changed
+	# since, in one write
 	def write(self, file=sys.stdout, stringdict=None):
-		file.write( "@%s{%s,\n"  % (self.getRefType(), self.getKey()) );
+		if self.raw != None:
+			file.write(self.raw + "\n\n");
+			return;
+		out = [ "@%s{%s,\n"  % (self.getRefType(), self.getKey()) ];
 		count = 0
-		for rk in self.fieldDict:
+		for rk in self.fields:
 			count += 1;
-			# skip internally used fields
-			if rk[0] == '_':
-				continue;
 			if rk == 'Type':
 				continue;
 
 			# generate the entry
-			value = self.fieldDict[rk];
-			file.write("    %s = " % rk );
+			value = self.lookup(rk);
+			out.append("    %s = " % rk );
 
 			if rk in ['Author', 'Editor']:
-				file.write("{%s}" % " and ".join(value) );
+				out.append("{%s}" % " and ".join(value) );
 			elif rk == 'Month':
 				if value:
-					file.write("{%s}" % value );
+					out.append("{%s}" % value );
 				else:
 					value = self.getMonthName();
-					file.write("%s" % value[0:3].lower() );
+					out.append("%s" % value[0:3].lower() );
 			else:
 				# is it an abbrev?
 				if value in self.bibliography.abbrevDict:
-					file.write("%s" % value );
+					out.append("%s" % value );
 				else:
-					file.write("{%s}" % value );
+					out.append("{%s}" % value );
 
 			# add comma to all but last fields
-			if count < len(self.fieldDict):
-				file.write(",\n");
+			if count < len(self.fields):
+				out.append(",\n");
 			else:
-				file.write("\n");
-		file.write("}\n\n");
-
+				out.append("\n");
+		out.append("}\n\n");
+		file.write(string.join(out, ''));
+
+
+	def setField(self, field, value, lazy=None):
+		if lazy == None:
+			lazy = self.bibliography.lazy;
+		if lazy and field.lower() in ["author", "editor", "year", "month"]:
+			# keep the text, to be interpreted when it is read
+			key = field.capitalize();
+			self.store(key, Pending(field, value));
+			if key == 'Year':
+				self.year = None;
+			elif key == 'Month':
+				self.month = None;
+			return;
 
-	def setField(self, field, value):
 		def strStrip(s):
 			s = string.strip(s, ' ');
 			if (s[0] == '"') and (s[-1] == '"'):
@@ -91,38 +116,722 @@ class BibTeXEntry(BibEntry.BibEntry):
 			return s;
 
 
+		# fields that are interpreted when set need their text now
+		if isinstance(value, FieldSpan) and field.lower() in ["author", "editor", "year", "month"]:
+			value = str(value);
+
 		# deal specially with author list, convert from bibtex X and Y to
-		# a list for bibentry class
+		# a tuple for bibentry class
 		if field.lower() in ["author", "editor"]:
 			value = string.split(value, " and ");
-			value = map(strStrip, value);
+			value = tuple(map(strStrip, value));
 		try:
 			# invoke the superclass
 			BibEntry.BibEntry.setField(self, field, value);
 		except AttributeError, err:
 			sys.stderr.write( "%15s: bad value <%s=%s>" % (self.getKey(), field, value));
 
+# lexical analyzer for bibtex format files
+class BibLexer:
+
+	inString = "";	# the string to parse
+	lineNum = 1;
+	pos = 0;
+
+	def __init__(self, s):
+		self.inString = s;
+
+	# an iterator for the class, return next character
+	def next(self):
+		if self.pos >= len(self.inString):
+			raise StopIteration;
+		c = self.inString[self.pos];
+		if c == '\n':
+			self.lineNum += 1;
+		self.pos += 1;
+		return c;
+
+	def __iter__(self):
+		return self;
+
+	# peek at the next character
+	def peek(self):
+		return self.inString[self.pos];
+
+	# push a character back onto the input
+	def pushback(self, c):
+		self.pos -= 1;
+		if c == '\n':
+			self.lineNum -= 1;
+
+	# eat whitepsace characters and comments
+	def skipwhite(self):
+		
+		for c in self:
+			if c == '%':
+				for c in self:
+					if c == '\n':
+						break;
+			elif (not c.isspace()):
+				self.pushback(c);
+				break;
+
+	# line number of the current position, for error messages
+	def line(self):
+		return self.lineNum;
+
+	# print >> sys.stderr, the input buffer
+	def show(self):
+		print >> sys.stderr, "[%c]%s" % (self.inString[0], self.inString[1:10]);
+
+	# get the next word from the input stream, this can be
+	#	[alpha][alnum$_-]
+	#	"...."
+	#	{....}
+	def nextword(self):
+
+		str = "";
+		c = self.peek();
+
+		if c == '"':
+			# quote delimited string
+			str = self.next();
+			cp = None;	# prev char
+			for c in self:
+				str += c;
+				if (c == '"') and (cp != '\\'):
+					break;
+				cp = c;
+		elif c == '{':
+			# brace delimited string
+			count = 0;
+			for c in self:
+				if c == '{':
+					count += 1;
+				if c == '}':
+					count -= 1;
+					
+				str += c;
+				if count == 0:
+					break;
+		else:
+			# undelimited string
+			#if (not c.isalpha()):
+			#	print >> sys.stderr, "BAD STRING"
+			for c in self:
+				if c.isalnum():
+					str += c;
+				elif c in ".+-_$:'":
+					str += c;
+				else:
+					self.pushback(c);
+					break;
+		return str;
+
+
+# lexical analyzer that scans whole tokens at a time using compiled patterns
+# and slicing, rather than a method call and string append per character.
+# It has the same interface as BibLexer, and returns the same words.
+class BibFastLexer:
+
+	reWhite = re.compile(r"""(?:\s+|%[^\n]*)*""");
+	reQuote = re.compile(r'''"(?:[^"]|(?<=\\)")*(?<!\\)"''');
+	reBrace = re.compile(r"""[{}]""");
+	reWord = re.compile(r"""[A-Za-z0-9.+\-_$:']*""");
+
+	def __init__(self, s):
+		self.inString = s;
+		self.pos = 0;
+		self.end = len(s);
+
+	# an iterator for the class, return next character
+	def next(self):
+		pos = self.pos;
+		if pos >= self.end:
+			raise StopIteration;
+		self.pos = pos + 1;
+		return self.inString[pos];
+
+	def __iter__(self):
+		return self;
+
+	# peek at the next character
+	def peek(self):
+		return self.inString[self.pos];
+
+	# push a character back onto the input
+	def pushback(self, c):
+		self.pos -= 1;
+
+	# eat whitepsace characters and comments
+	def skipwhite(self):
+		self.pos = self.reWhite.match(self.inString, self.pos).end();
+
+	# line number of the current position, only computed when needed.
+	# Counted a block at a time since a mmap has no count method.
+	def line(self):
+		n = 1;
+		for i in xrange(0, self.pos, 1<<20):
+			n += self.inString[i:min(i + (1<<20), self.pos)].count('\n');
+		return n;
+
+	# print >> sys.stderr, the input buffer
+	def show(self):
+		print >> sys.stderr, "[%c]%s" % (self.inString[0], self.inString[1:10]);
+
+	# get the next word from the input stream, see BibLexer.nextword
+	def nextword(self):
+		start = self.pos;
+		self.pos = self.wordend(start);
+		return self.inString[start:self.pos];
+
+	# return the end of the word starting at start.  Unterminated strings
+	# run to the end of the input.
+	def wordend(self, start):
+		s = self.inString;
+		c = s[start];
+
+		if c == '"':
+			# quote delimited string
+			m = self.reQuote.match(s, start);
+			if m:
+				end = m.end();
+			else:
+				end = self.end;
+		elif c == '{':
+			# brace delimited string
+			end = self.end;
+			count = 0;
+			for m in self.reBrace.finditer(s, start):
+				if m.group() == '{':
+					count += 1;
+				else:
+					count -= 1;
+					if count == 0:
+						end = m.end();
+						break;
+		else:
+			# undelimited string
+			end = self.reWord.match(s, start).end();
+
+		return end;
+
+# the text of a string between two offsets of a buffer, such as a mmap, which
+# is only copied out when it is needed.  Supports the indexing and slicing the
+# parser does on strings.
+class FieldSpan(BibEntry.Deferred):
+	__slots__ = ('buf', 'start', 'end');
+
+	def __init__(self, buf, start, end):
+		self.buf = buf;
+		self.start = start;
+		self.end = end;
+
+	def __len__(self):
+		return self.end - self.start;
+
+	# negative indices have already had the length added
+	def __getslice__(self, i, j):
+		i = min(max(i, 0), len(self));
+		j = min(max(j, i), len(self));
+		return FieldSpan(self.buf, self.start + i, self.start + j);
+
+	def __getitem__(self, i):
+		if isinstance(i, slice):
+			start, end, step = i.indices(len(self));
+			return FieldSpan(self.buf, self.start + start, self.start + max(start, end));
+		if i < 0:
+			return self.buf[self.end + i];
+		return self.buf[self.start + i];
+
+	def __str__(self):
+		return self.buf[self.start:self.end];
+
+	def __repr__(self):
+		return "<FieldSpan %d:%d>" % (self.start, self.end);
+
+	def isalnum(self):
+		return str(self).isalnum();
+
+	def value(self):
+		return str(self);
+
+# the text of an author, editor, year or month field of an entry in a lazy
+# bibliography, which is interpreted by setField when it is first read.  Any
+# error in it is reported then, as it would have been by the parser.
+class Pending(BibEntry.Deferred):
+	__slots__ = ('field', 'text');
+
+	# field is the name as given to setField
+	def __init__(self, field, text):
+		self.field = field;
+		self.text = text;
+
+	def value(self):
+		return str(self.text);
+
+	def resolve(self, be, i):
+		# the text stays if it cannot be interpreted
+		be.values[i] = self.value();
+		if be.fields[i] == 'Month':
+			be.month = -1;
+		# interpreting the text does not change the entry
+		raw = be.raw;
+		be.setField(self.field, self.text, False);
+		be.raw = raw;
+		return be.values[i];
+
+# lexical analyzer for a memory mapped file, as for BibFastLexer but quote
+# and brace delimited strings are returned as FieldSpans of the mapping
+class BibMappedLexer(BibFastLexer):
+
+	def nextword(self):
+		start = self.pos;
+		self.pos = self.wordend(start);
+		if self.inString[start] in '"{':
+			return FieldSpan(self.inString, start, self.pos);
+		return self.inString[start:self.pos];
+
+# the available lexical analyzers, selected by name
+lexers = {
+	'char' : BibLexer,
+	'fast' : BibFastLexer,
+	'mapped' : BibMappedLexer };
+
+
+class Token:
+	t_ENTRY = 1;
+	t_DELIM_L = 2;
+	t_DELIM_R = 3;
+	t_STRING = 5;
+	t_EQUAL = 6;
+	t_COMMA = 7;
+
+	val = None;
+	type = None;
+
+	def __repr__(self):
+		if self.type == self.t_ENTRY:
+			str = "@ %s" % self.val;
+		elif self.type == self.t_DELIM_R:
+			str = "  }";
+		elif self.type == self.t_STRING:
+			str = "<%s>" % self.val;
+		elif self.type == self.t_EQUAL:
+			str = "  EQUAL";
+		elif self.type == self.t_COMMA:
+			str = "  COMMA";
+		else:
+			str = "BAD TOKEN (%d) <%s>" % (self.type, self.val);
+		return str;
+
+	# tokens are equal if they have the same type and value, used to
+	# compare the output of the lexical analyzers
+	def __eq__(self, t):
+		return (self.type == t.type) and (self.val == t.val);
+
+	def __ne__(self, t):
+		return not self.__eq__(t);
+
+	def isstring(self):
+		return self.type == self.t_STRING;
+
+	def isabbrev(self):
+		return (self.type == self.t_STRING) and self.val.isalnum();
+
+	def iscomma(self):
+		return self.type == self.t_COMMA;
+
+	def isequal(self):
+		return self.type == self.t_EQUAL;
+
+	def isentry(self):
+		return self.type == self.t_ENTRY;
+
+	def isdelimR(self):
+		return self.type == self.t_DELIM_R;
+
+	def isdelimL(self):
+		return self.type == self.t_DELIM_L;
+
+#
+# tokenizer for bibtex format files
+#
+class BibTokenizer:
+
+	lex = None;
+
+	def __init__(self, s, lexer=BibFastLexer):
+		self.lex = lexer(s);
+		
+	# setup an iterator for the next token
+	def __iter__(self):
+		return self;
+
+	# return next token
+	def next(self):
+		#self.lex.show();
+		self.lex.skipwhite();
+		c = self.lex.next();
+
+		t = Token();
+		if c == '@':
+			t.type = t.t_ENTRY;
+			self.lex.skipwhite();
+			t.val = self.lex.nextword();
+			self.lex.skipwhite();
+			c = self.lex.next();
+			if not ((c == '{') or (c == '(')):
+				print >> sys.stderr, "BAD START OF ENTRY"
+
+		elif c == ',':
+			t.type = t.t_COMMA;
+		elif c == '=':
+			t.type = t.t_EQUAL;
+		elif (c == '}') or (c == ')'):
+			t.type = t.t_DELIM_R;
+		else:
+			self.lex.pushback(c);
+			t.type = t.t_STRING;
+			t.val = self.lex.nextword();
+
+		return t;
+
+
+class BibParser:
+
+	tok = None;
+	bibtex = None;
+
+	def __init__(self, s, bt, ignore=False, lexer=BibFastLexer, retain=True):
+		self.tok = BibTokenizer(s, lexer);
+		self.bibtex = bt;
+		self.ignore = ignore;
+		self.retain = retain;	# insert entries into the bibliography
+
+	# setup an iterator for the next entry
+	def __iter__(self):
+		return self;
+
+	# return next entry, a BibTeXEntry, or a tuple (abbrev, value) for a
+	# string definition, or None for a comment
+	def next(self):
+
+		def strstrip(s):
+			if s[0] in '"{':
+				return s[1:-1];
+			else:
+				return s;
+
+		lex = self.tok.lex;
+		lex.skipwhite();
+		start = lex.pos;
+		t = self.tok.next();
+		if not t.isentry():
+			raise SyntaxError, self.tok.lex.line();
+		if t.val.lower() == 'string':
+			tn = self.tok.next();
+			if not tn.isstring():
+				raise SyntaxError, self.tok.lex.line();
+			t = self.tok.next();
+			if not t.isequal():
+				raise SyntaxError, self.tok.lex.line();
+			tv = self.tok.next();
+			if not tv.isstring():
+				raise SyntaxError, self.tok.lex.line();
+			# insert string into the string table
+			value = str(strstrip(tv.val));
+			self.bibtex.insertAbbrev(tn.val, value);
+			#print >> sys.stderr, "string", tn.val, tv.val
+			t = self.tok.next();
+			if not t.isdelimR():
+				raise SyntaxError, self.tok.lex.line();
+			return (tn.val, value);
+		elif t.val.lower() == 'comment':
+			# skip to the closing delimiter, nested braces are returned
+			# by the tokenizer as part of a string
+			for tn in self.tok:
+				if tn.isdelimR():
+					break;
+			return None;
+		else:
+			# NOT A STRING or COMMENT ENTRY
+			# assume a normal reference type
+
+			# get the cite key
+			ck = self.tok.next();
+			if not ck.isstring():
+				raise SyntaxError, self.tok.lex.line();
+
+			#print >> sys.stderr, t.val, ck.val
+			be = self.bibtex.entryClass(ck.val, self.bibtex);
+			be.setType(t.val);
+
+			# get the comma
+			ck = self.tok.next();
+			if not ck.iscomma():
+				raise SyntaxError, self.tok.lex.line();
+
+			# get the field value pairs
+			for tf in self.tok:
+				# allow for poor syntax with comma before
+				# end brace
+				if tf.isdelimR():
+					break;
+
+				if not tf.isstring():
+					raise SyntaxError, self.tok.lex.line();
+				t = self.tok.next();
+				if not t.isequal():
+					raise SyntaxError, self.tok.lex.line();
+				ts = self.tok.next();
+				if not ts.isstring():
+					raise SyntaxError, self.tok.lex.line();
+				#print >> sys.stderr, "  ", tf.val, " := ", ts.val;
+				be.setField(tf.val, strstrip(ts.val));
+
+				# if it was an abbrev in the file, put it in the
+				# abbrevDict so it gets written as an abbrev
+				if ts.isabbrev():
+					self.bibtex.insertAbbrev(ts.val, None);
+					#print >> sys.stderr, "putting unresolved abbrev %s into dict" % ts.val;
+
+				t = self.tok.next();
+				if t.iscomma():
+					continue;
+				elif t.isdelimR():
+					break;
+				else:
+					raise SyntaxError, self.tok.lex.line();
+
+			self.bibtex.keepText(be, lex.inString, start, lex.pos);
+
+			if self.retain:
+				self.bibtex.insertEntry(be, self.ignore);
+			return be;
+
+
+# return a list of all tokens in the string, using the named lexical analyzer.
+# Used to check that the lexical analyzers agree, and to time them.
+def tokenize(s, lexer='fast'):
+	return [t for t in BibTokenizer(s, lexers[lexer])];
+
+reEntryHead = re.compile(r"""@(?:\s+|%[^\n]*)*[A-Za-z0-9.+\-_$:']*(?:\s+|%[^\n]*)*[{(]""");
+reEntryBody = re.compile(r"""[{}()"%]""");
+reQuoteEnd = re.compile(r'(?<!\\)"');
+
+# find the top-level entries in the string, starting at pos, and return an
+# iterator over their (start, end) offsets, from the @ to just after the
+# closing delimiter.  Delimiters are matched the same way the tokenizer
+# matches them: braces nest, quoted strings and % comments are skipped at the
+# outer level, and either } or ) closes the entry.  Stops at the first entry
+# that is incomplete or malformed.
+def entrySpans(s, pos=0):
+	return EntryScanner(pos).spans(s);
+
+# scanner for entrySpans that can be resumed.  When the string ends part way
+# through an entry, the position, brace depth and any quote or comment being
+# skipped are kept, so that after more text is appended to the string
+# scanning carries on from there rather than from the start of the entry.
+class EntryScanner:
+
+	def __init__(self, pos=0):
+		self.pos = pos;		# where to resume scanning
+		self.start = None;	# start of the unfinished entry
+		self.depth = 0;		# brace depth within it
+		self.skip = None;	# closing quote or newline being skipped to
+
+	# iterate over the (start, end) offsets of the entries of s that
+	# are complete, from where the last call left off
+	def spans(self, s):
+		pos = self.pos;
+		while True:
+			if self.start == None:
+				m = BibFastLexer.reWhite.match(s, pos);
+				at = s.find('@', m.end());
+				if at < 0:
+					break;
+				m = reEntryHead.match(s, at);
+				if not m:
+					pos = at;
+					break;
+				self.start = at;
+				self.depth = 0;
+				pos = m.end();
+			pos = self.body(s, pos);
+			if pos < 0:
+				pos = len(s);
+				break;
+			start = self.start;
+			self.start = None;
+			self.pos = pos;
+			yield (start, pos);
+		self.pos = pos;
+
+	# scan the body of the current entry from pos, return the offset just
+	# after its closing delimiter or -1 if s ends first
+	def body(self, s, pos):
+		while True:
+			if self.skip == '"':
+				m = reQuoteEnd.search(s, pos);
+				if not m:
+					return -1;
+				pos = m.end();
+			elif self.skip == '\n':
+				pos = s.find('\n', pos);
+				if pos < 0:
+					return -1;
+			self.skip = None;
+			m = reEntryBody.search(s, pos);
+			if not m:
+				return -1;
+			c = m.group();
+			pos = m.end();
+			if c == '{':
+				self.depth += 1;
+			elif self.depth > 0:
+				if c == '}':
+					self.depth -= 1;
+			elif c in '})':
+				return pos;
+			elif c == '"':
+				self.skip = '"';
+			elif c == '%':
+				self.skip = '\n';
+
+	# offsets are relative to a string that has had n characters removed
+	# from its front
+	def shift(self, n):
+		self.pos -= n;
+		if self.start != None:
+			self.start -= n;
+
+# the length of the longest common prefix of two strings, found by comparing
+# blocks and then halving the block size
+def commonPrefix(a, b):
+	n = min(len(a), len(b));
+	pos = 0;
+	step = 1<<16;
+	while pos < n and a[pos:pos+step] == b[pos:pos+step]:
+		pos += step;
+	while step > 1:
+		step //= 2;
+		if a[pos:pos+step] == b[pos:pos+step]:
+			pos += step;
+	return min(pos, n);
+
+# the length of the longest common suffix of two strings, no more than limit
+def commonSuffix(a, b, limit):
+	na = len(a);
+	nb = len(b);
+	n = 0;
+	step = 1<<16;
+	while n < limit and a[max(na-n-step, 0):na-n] == b[max(nb-n-step, 0):nb-n]:
+		n += step;
+	while step > 1:
+		step //= 2;
+		if n + step <= limit and a[na-n-step:na-n] == b[nb-n-step:nb-n]:
+			n += step;
+	return min(n, limit);
+
+# poll the modification times of a list of files, and yield the list of
+# those that have changed, all of them to start with
+def watch(fileNames, interval=0.5):
+	stamps = {};
+	while True:
+		changed = [];
+		for f in fileNames:
+			try:
+				st = os.stat(f);
+				stamp = (st.st_mtime, st.st_size);
+			except EnvironmentError:
+				stamp = None;
+			if stamps.get(f, 0) != stamp:
+				stamps[f] = stamp;
+				changed.append(f);
+		if changed:
+			yield changed;
+		time.sleep(interval);
+
 class BibTeX(Bibliography.Bibliography):
 
 	stringDict = {};
-
-	def parseFile(self, fileName=None, verbose=0, ignore=False):
+	entryClass = BibTeXEntry;	# class of the entries the parser creates
+	lexer = 'fast';		# name of the lexical analyzer, see lexers
+	chunksize = 65536;	# bytes read at a time by iterparse
+	mapped = False;		# memory map local files in parseFile
+	lazy = False;		# interpret names, years and months when read
+	splitsize = 1<<20;	# smallest piece of a string parsed by a worker
+	cache = BibCache.fromEnvironment();	# cache of parsed files, or None
+	source = None;		# the string last given to update
+	broken = False;		# if it has an error
+	verbatim = False;	# keep the text of entries, to write them as read
+
+	# parse a file into the bibliography.  If mapped is set, and the file
+	# can be memory mapped, field values are left in the mapping and only
+	# copied out when they are read.  A compressed file is decompressed as
+	# it is read, see BibCodec, and so never mapped.
+	#
+	# With more than one job the file is split between worker processes,
+	# see parseString.  If there is a cache, a local file is parsed only if
+	# it is not in the cache.
+	def parseFile(self, fileName=None, verbose=0, ignore=False, lexer=None, mapped=None, jobs=1):
 		if fileName == None:
-			fp = sys.stdin;
+			fp = BibCodec.reader(sys.stdin);
 		else:
 			fp = self.open(fileName);
+		if mapped == None:
+			mapped = self.mapped;
+
+		# get the file into one huge string, or a mapping
+		s = None;
+		cached = self.cacheFor(fp);
+		if mapped and jobs <= 1 and not cached:
+			try:
+				s = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ);
+				lexer = 'mapped';
+			except (AttributeError, ValueError, EnvironmentError):
+				# not a regular file, or empty
+				pass;
+		if s == None:
+			s = fp.read();
+		nbib = self.parseText(fp, s, verbose, ignore, lexer, jobs);
+		self.close(fp);
+		return nbib;
 
-		# get the file into one huge string
+	# parse s, the contents of the file open on fp, into the bibliography
+	# and return the number of entries added, see parseFile
+	def parseText(self, fp, s, verbose=0, ignore=False, lexer=None, jobs=1):
 		nbib = 0;
-		s = fp.read();
 		try:
-			nbib = self.parseString(s, ignore=ignore, verbose=verbose);
+			if self.cacheFor(fp):
+				nbib = len(self);
+				self.replay(self.record(fp.name, s, lexer, jobs), ignore, s);
+				nbib = len(self) - nbib;
+			else:
+				nbib = self.parseString(s, ignore=ignore, verbose=verbose, lexer=lexer, jobs=jobs);
 		except AttributeError, err:
 			print >> sys.stderr, "Error %s" % err;
-
-		self.close(fp);
 		return nbib;
 
+	# the cache to use for the file open on fp, or None if there is no
+	# cache or fp is not a local file
+	def cacheFor(self, fp):
+		if self.cache and os.path.isfile(getattr(fp, 'name', '')):
+			return self.cache;
+		return None;
+
+	# return the recording of the contents s of a file, see BibRecorder,
+	# from the cache, or by parsing s and saving the result in the cache
+	def record(self, fileName, s, lexer=None, jobs=1):
+		ops = self.cache.load(fileName, s);
+		if ops == None:
+			rec = BibRecorder();
+			rec.parseString(s, lexer=lexer, jobs=jobs);
+			ops = rec.ops;
+			self.cache.store(fileName, s, ops);
+		return ops;
+
 	def display(self):
 		for be in self:
 		        be.display()
@@ -140,6 +849,16 @@ class BibTeX(Bibliography.Bibliography):
 		for abbrev, value in self.abbrevDict.items():
 		        file.write("@string{ %s = {%s} }\n" % (abbrev, value) );
 
+	# interpret the year and month fields that a lazy parse left as text
+	# and that have not been read, so that any errors in them are reported
+	# as the parse would have reported them.  Splitting author and editor
+	# names reports nothing, so they are left.
+	def checkPending(self):
+		for be in self:
+			for i, k in enumerate(be.fields):
+				if k in ('Year', 'Month') and isinstance(be.values[i], Pending):
+					be.values[i].resolve(be, i);
+
 	# resolve BibTeX's cross reference capability
 	def resolveCrossRef(self):
 		for be in self:
@@ -152,305 +871,537 @@ class BibTeX(Bibliography.Bibliography):
 				if not (f in be):
 					be.setField(f, xref.getField(f));
 
-	def parseString(self, s, verbose=0, ignore=False):
+	# parse a string into the bibliography.  With more than one job a large
+	# string is cut between top-level entries into pieces that are parsed
+	# in a pool of worker processes, and the results replayed in order, so
+	# string definitions precede the entries that use them, and the parse
+	# stops at the first syntax error, reported at its line in s.
+	def parseString(self, s, verbose=0, ignore=False, lexer=None, jobs=1):
 
-		# lexical analyzer for bibtex format files
-		class BibLexer:
+		if jobs > 1 and len(s) > self.splitsize:
+			return self.parseSplit(s, jobs, ignore, lexer);
 
-			inString = "";	# the string to parse
-			lineNum = 1;
-			pos = 0;
-
-			def __init__(self, s):
-				self.inString = s;
-
-			# an iterator for the class, return next character
-			def next(self):
-				if self.pos >= len(self.inString):
-					raise StopIteration;
-				c = self.inString[self.pos];
-				if c == '\n':
-					self.lineNum += 1;
-				self.pos += 1;
-				return c;
-
-			def __iter__(self):
-				return self;
+		bibcount = 0;
+		for be in self.parseItems(s, ignore=ignore, lexer=lexer):
+			bibcount += 1;
 
-			# peek at the next character
-			def peek(self):
-				return self.inString[self.pos];
+		return bibcount;
 
-			# push a character back onto the input
-			def pushback(self, c):
-				self.pos -= 1;
-				if c == '\n':
-					self.lineNum -= 1;
+	# iterate over the items parsed from the string s, see BibParser.next.
+	# line is the line number of the start of s, for error messages.
+	def parseItems(self, s, line=1, ignore=False, lexer=None, retain=True):
 
-			# eat whitepsace characters and comments
-			def skipwhite(self):
-				
-				for c in self:
-					if c == '%':
-						for c in self:
-							if c == '\n':
-								break;
-					elif (not c.isspace()):
-						self.pushback(c);
-						break;
+		if lexer == None:
+			lexer = self.lexer;
+		bibparser = BibParser(s, self, ignore, lexers[lexer], retain);
+		try:
+			for be in bibparser:
+				yield be;
+		except SyntaxError, err:
+			self.reportSyntaxError(err.args[0] + line - 1);
+
+	# keep the text of an entry, s[start:end], if verbatim is set
+	def keepText(self, be, s, start, end):
+		if self.verbatim:
+			be.raw = s[start:end];
+
+	def reportSyntaxError(self, line):
+		print "Syntax error at line " + str(line);
+		self.syntaxError = True;
+
+	# cut s into pieces of whole entries, each at least splitsize long,
+	# and parse them in worker processes, see parseString
+	def parseSplit(self, s, jobs, ignore=False, lexer=None):
+		if lexer in (None, 'mapped'):
+			lexer = self.lexer;
+		size = max(self.splitsize, len(s) // (4 * jobs));
+		pieces = [];
+		start = 0;
+		line = 1;
+		for _, end in entrySpans(s):
+			if end - start >= size:
+				pieces.append( (s[start:end], line, lexer) );
+				line += s.count('\n', start, end);
+				start = end;
+		pieces.append( (s[start:], line, lexer) );
+
+		nbib = len(self);
+		pool = multiprocessing.Pool(min(jobs, len(pieces)));
+		try:
+			for ops, piece in itertools.izip(pool.imap(splitWorker, pieces), pieces):
+				if not self.replay(ops, ignore, piece[0]):
+					break;
+		finally:
+			pool.terminate();
+		return len(self) - nbib;
+
+	# iterate over the entries and string definitions in a file, reading it
+	# a chunk at a time and yielding each BibTeXEntry, or (abbrev, value)
+	# tuple for a string definition, as soon as its closing brace is read.
+	#
+	# If retain is False the entries are not kept in the bibliography, only
+	# their keys are remembered so that duplicates can still be rejected.
+	# Either way an entry with a duplicate key is not yielded.
+	#
+	# If there is a cache, a local file is read whole and its recording
+	# replayed, see parseFile.
+	def iterparse(self, fileName=None, retain=True, ignore=False):
+		if fileName == None:
+			fp = BibCodec.reader(sys.stdin);
+		else:
+			fp = self.open(fileName);
 
-			# print >> sys.stderr, the input buffer
-			def show(self):
-				print >> sys.stderr, "[%c]%s" % (self.inString[0], self.inString[1:10]);
-
-			# get the next word from the input stream, this can be
-			#	[alpha][alnum$_-]
-			#	"...."
-			#	{....}
-			def nextword(self):
-
-				str = "";
-				c = self.peek();
-
-				if c == '"':
-					# quote delimited string
-					str = self.next();
-					cp = None;	# prev char
-					for c in self:
-						str += c;
-						if (c == '"') and (cp != '\\'):
-							break;
-						cp = c;
-				elif c == '{':
-					# brace delimited string
-					count = 0;
-					for c in self:
-						if c == '{':
-							count += 1;
-						if c == '}':
-							count -= 1;
-							
-						str += c;
-						if count == 0:
-							break;
-				else:
-					# undelimited string
-					#if (not c.isalpha()):
-					#	print >> sys.stderr, "BAD STRING"
-					for c in self:
-						if c.isalnum():
-							str += c;
-						elif c in ".+-_$:'":
-							str += c;
-						else:
-							self.pushback(c);
-							break;
-				return str;
-
-
-		class Token:
-			t_ENTRY = 1;
-			t_DELIM_L = 2;
-			t_DELIM_R = 3;
-			t_STRING = 5;
-			t_EQUAL = 6;
-			t_COMMA = 7;
-
-			val = None;
-			type = None;
-
-			def __repr__(self):
-				if self.type == self.t_ENTRY:
-					str = "@ %s" % self.val;
-				elif self.type == self.t_DELIM_R:
-					str = "  }";
-				elif self.type == self.t_STRING:
-					str = "<%s>" % self.val;
-				elif self.type == self.t_EQUAL:
-					str = "  EQUAL";
-				elif self.type == self.t_COMMA:
-					str = "  COMMA";
+		self.syntaxError = False;
+		if not hasattr(self, 'seenKeys'):
+			self.seenKeys = {};
+		if self.cacheFor(fp):
+			s = fp.read();
+			items = self.replayItems(self.record(fp.name, s), ignore, retain, s);
+		else:
+			items = self.streamItems(fp, retain, ignore);
+		try:
+			for x in items:
+				if x == None:
+					continue;
+				if isinstance(x, tuple):
+					pass;
+				elif retain:
+					# skip an entry that insertEntry refused
+					if self.keyDict.get(x.getKey()) is not x:
+						continue;
 				else:
-					str = "BAD TOKEN (%d) <%s>" % (self.type, self.val);
-				return str;
-
-			def isstring(self):
-				return self.type == self.t_STRING;
-
-			def isabbrev(self):
-				return (self.type == self.t_STRING) and self.val.isalnum();
-
-			def iscomma(self):
-				return self.type == self.t_COMMA;
-
-			def isequal(self):
-				return self.type == self.t_EQUAL;
-
-			def isentry(self):
-				return self.type == self.t_ENTRY;
-
-			def isdelimR(self):
-				return self.type == self.t_DELIM_R;
-
-			def isdelimL(self):
-				return self.type == self.t_DELIM_L;
-
-		#
-		# tokenizer for bibtex format files
-		#
-		class BibTokenizer:
-
-			lex = None;
-
-			def __init__(self, s):
-				self.lex = BibLexer(s);
-				
-			# setup an iterator for the next token
-			def __iter__(self):
-				return self;
-
-			# return next token
-			def next(self):
-				#self.lex.show();
-				self.lex.skipwhite();
-				c = self.lex.next();
-
-				t = Token();
-				if c == '@':
-					t.type = t.t_ENTRY;
-					self.lex.skipwhite();
-					t.val = self.lex.nextword();
-					self.lex.skipwhite();
-					c = self.lex.next();
-					if not ((c == '{') or (c == '(')):
-						print >> sys.stderr, "BAD START OF ENTRY"
-
-				elif c == ',':
-					t.type = t.t_COMMA;
-				elif c == '=':
-					t.type = t.t_EQUAL;
-				elif (c == '}') or (c == ')'):
-					t.type = t.t_DELIM_R;
+					key = x.getKey();
+					if key in self.seenKeys:
+						if not ignore:
+							print >> sys.stderr, "key %s already in dictionary" % (key)
+						continue;
+					self.seenKeys[key] = None;
+				yield x;
+		except AttributeError, err:
+			print >> sys.stderr, "Error %s" % err;
+		finally:
+			self.close(fp);
+
+	# iterate over the items parsed from a file a chunk at a time, see
+	# iterparse
+	def streamItems(self, fp, retain=True, ignore=False):
+		buf = "";
+		line = 1;
+		scanner = EntryScanner();
+		while True:
+			data = fp.read(self.chunksize);
+			buf += data;
+			if data:
+				# parse up to the end of the last complete entry, the
+				# scanner resumes where it stopped in the last chunk
+				end = 0;
+				for start, end in scanner.spans(buf):
+					pass;
+				if end == 0:
+					continue;
+			else:
+				end = len(buf);
+
+			for x in self.parseItems(buf[:end], line, ignore, retain=retain):
+				yield x;
+			if self.syntaxError or not data:
+				break;
+			line += buf.count('\n', 0, end);
+			buf = buf[end:];
+			scanner.shift(end);
+
+	# parse a list of files, or stdin if the list is empty, into the
+	# bibliography and return the number of entries added.  With more than
+	# one job the files are parsed in a pool of worker processes and the
+	# results replayed in the order given, so duplicate keys, abbreviations
+	# and messages are exactly as if the files were parsed one at a time.
+	def parseFiles(self, fileNames, jobs=1, ignore=False):
+		nbib = len(self);
+		if not fileNames:
+			self.parseFile(ignore=ignore, jobs=jobs);
+		elif jobs <= 1 or len(fileNames) == 1:
+			for f in fileNames:
+				self.parseFile(f, ignore=ignore, jobs=jobs);
+		else:
+			pool = multiprocessing.Pool(min(jobs, len(fileNames)));
+			try:
+				work = [(f, self.verbatim) for f in fileNames];
+				for filename, ops, s in pool.imap(parseWorker, work):
+					self.replay(ops, ignore, s);
+					self.filename = filename;
+			finally:
+				pool.terminate();
+		return len(self) - nbib;
+
+	# insert the abbreviations and entries recorded by a BibRecorder,
+	# return False if the recording ends in an error.  s is the string that
+	# was recorded, if the text of the entries is to be kept.
+	def replay(self, ops, ignore=False, s=None):
+		try:
+			for x in self.replayItems(ops, ignore, s=s):
+				pass;
+		except AttributeError, err:
+			print >> sys.stderr, "Error %s" % err;
+			return False;
+		return not (ops and ops[-1][0] == 'error');
+
+	# iterate over the items in a recording, inserting them into the
+	# bibliography, as parseItems does for the string s that was recorded
+	def replayItems(self, ops, ignore=False, retain=True, s=None):
+		for op in ops:
+			if op[0] == 'abbrev':
+				self.insertAbbrev(op[1], op[2]);
+				if op[2] != None:
+					# a string definition, not just a use
+					yield op[1:];
+			elif op[0] == 'error':
+				self.reportSyntaxError(op[1]);
+				return;
+			else:
+				be = self.makeEntry(op[1], op[2], op[3]);
+				if s != None:
+					self.keepText(be, s, op[4], op[5]);
+				if retain:
+					self.insertEntry(be, ignore);
+				yield be;
+
+	# make an entry, as the parser would, from a recording
+	def makeEntry(self, reftype, key, fields):
+		be = self.entryClass(key, self);
+		be.setType(reftype);
+		for field, value in fields:
+			be.setField(field, value);
+		return be;
+
+	# parse s, the new contents of a file that is all of the bibliography,
+	# and return the entries that were parsed.  The first time all of s is
+	# parsed.  After that only the entries that differ from the string
+	# last given are parsed, and keyList, keyDict and abbrevDict are
+	# patched to be as a parse of s would leave them.  The order of keyList
+	# must not be changed between updates.
+	#
+	# s is kept as pieces, each the text up to the end of an entry as found
+	# by entrySpans, with the entries and abbreviations parsed from it.  The
+	# text that differs is found by the common prefix and suffix of the old
+	# and new strings.  The new text is scanned for entries from the end of
+	# the last piece before the difference, until an entry ends where a
+	# piece of the old text did, in the common suffix.  The number of
+	# entries with each key in all the pieces is kept, so that a key of
+	# the changed entries that is also used outside them, where one entry
+	# may shadow another, can be found without looking at every piece.
+	def update(self, s, ignore=False):
+		old = self.source;
+		if old == None or self.broken:
+			return self.updateAll(s, ignore);
+		if old == s:
+			return [];
+		p = commonPrefix(old, s);
+		q = commonSuffix(old, s, min(len(old), len(s)) - p);
+		delta = len(s) - len(old);
+		first = bisect.bisect_right(self.ends, p);
+		start = self.ends[first-1] if first > 0 else 0;
+
+		# the new pieces, replacing the old pieces first to last-1
+		ends = [];
+		last = len(self.pieces);
+		for _, end in entrySpans(s, start):
+			ends.append(end);
+			if end - delta >= len(old) - q:
+				k = bisect.bisect_left(self.ends, end - delta);
+				if k < len(self.ends) and self.ends[k] == end - delta:
+					last = k + 1;
+					break;
+		else:
+			if not ends or ends[-1] < len(s):
+				ends.append(len(s));
+
+		pieces, error = self.parsePieces(s, start, ends, ignore);
+		if error:
+			# stop where a parse of s would
+			return self.updateAll(s, ignore);
+
+		# the entries of the old pieces that are in keyList
+		removedPieces = self.pieces[first:last];
+		removed = [be for entries, abbrevs in removedPieces for be in entries];
+		added = [be for entries, abbrevs in pieces for be in entries];
+		kept = [be for be in removed if self.keyDict.get(be.key) is be];
+		if kept:
+			pos = self.keyList.index(kept[0]);
+		else:
+			pos = len(self.keyList);
+			for entries, abbrevs in self.pieces[last:]:
+				for be in entries:
+					if self.keyDict.get(be.key) is be:
+						pos = self.keyList.index(be);
+						break;
 				else:
-					self.lex.pushback(c);
-					t.type = t.t_STRING;
-					t.val = self.lex.nextword();
-
-				return t;
-
-
-		class BibParser:
-
-			tok = None;
-			bibtex = None;
-
-			def __init__(self, s, bt):
-				self.tok = BibTokenizer(s);
-				self.bibtex = bt;
-
-			# setup an iterator for the next entry
-			def __iter__(self):
-				return self;
-
-			# return next entry
-			def next(self):
-
-				def strstrip(s):
-					if s[0] in '"{':
-						return s[1:-1];
+					continue;
+				break;
+		oldkeys = set(be.key for be in removed);
+		newkeys = set(be.key for be in added);
+		counts = collections.Counter(be.key for be in removed);
+		outside = [k for k in oldkeys | newkeys if self.keyCounts.get(k, 0) > counts[k]];
+		self.keyCounts.subtract(counts);
+		self.keyCounts.update(be.key for be in added);
+		if outside or len(kept) < len(removed) or len(newkeys) < len(added):
+			# a duplicated key, insert all the entries again in order
+			self.pieces[first:last] = pieces;
+			self.keyList[:] = [];
+			self.keyDict.clear();
+			new = set(map(id, added));
+			for entries, abbrevs in self.pieces:
+				for be in entries:
+					self.insertEntry(be, ignore or id(be) not in new);
+		else:
+			for be in kept:
+				del self.keyDict[be.key];
+			self.keyList[pos:pos+len(kept)] = added;
+			for be in added:
+				self.keyDict[be.key] = be;
+			self.pieces[first:last] = pieces;
+		if self.textIndex != None:
+			self.buildIndex();
+		self.dateIndex = None;
+
+		if [a for e, abbrevs in removedPieces for a in abbrevs] != [a for e, abbrevs in pieces for a in abbrevs]:
+			# abbreviations defined or used have changed, insert them all
+			# again in order
+			self.abbrevDict.clear();
+			for entries, abbrevs in self.pieces:
+				for abbrev, value in abbrevs:
+					self.insertAbbrev(abbrev, value);
+		self.ends[first:last] = array.array('l', ends);
+		j = first + len(ends);
+		self.ends[j:] = array.array('l', [e + delta for e in self.ends[j:]]);
+		self.source = s;
+		return added;
+
+	# parse all of s for update, stopping at the first error
+	def updateAll(self, s, ignore=False):
+		self.keyList[:] = [];
+		self.keyDict.clear();
+		self.abbrevDict.clear();
+		ends = [end for _, end in entrySpans(s)];
+		if not ends or ends[-1] < len(s):
+			ends.append(len(s));
+		pieces, error = self.parsePieces(s, 0, ends, ignore);
+		added = [];
+		for entries, abbrevs in pieces:
+			for abbrev, value in abbrevs:
+				self.insertAbbrev(abbrev, value);
+			for be in entries:
+				self.insertEntry(be, ignore);
+			added.extend(entries);
+		if error:
+			if error[0] == 'error':
+				self.reportSyntaxError(error[1]);
+			else:
+				print >> sys.stderr, "Error %s" % error[1];
+		if self.textIndex != None:
+			self.buildIndex();
+		self.dateIndex = None;
+		self.pieces = pieces;
+		self.keyCounts = collections.Counter(be.key for be in added);
+		self.ends = array.array('l', ends[:len(pieces)]);
+		self.source = s;
+		self.broken = error != None;
+		return added;
+
+	# parse the pieces of s from start to each of ends in turn, and return
+	# a list of the entries and abbreviations of each, and None or the
+	# first error, ('error', line) or ('exception', error).  After an error
+	# there are no more pieces.
+	def parsePieces(self, s, start, ends, ignore=False):
+		rec = BibRecorder();
+		line = s.count('\n', 0, start) + 1;
+		pieces = [];
+		for end in ends:
+			rec.ops = [];
+			piece = s[start:end];
+			for x in rec.parseItems(piece, line, ignore):
+				pass;
+			entries = [];
+			abbrevs = [];
+			error = None;
+			try:
+				for op in rec.ops:
+					if op[0] == 'abbrev':
+						abbrevs.append(op[1:]);
+					elif op[0] == 'error':
+						error = op;
 					else:
-						return s;
-
-				t = self.tok.next();
-				if not t.isentry():
-					raise SyntaxError, self.tok.lex.lineNum;
-				if t.val.lower() == 'string':
-					tn = self.tok.next();
-					if not tn.isstring():
-						raise SyntaxError, self.tok.lex.lineNum;
-					t = self.tok.next();
-					if not t.isequal():
-						raise SyntaxError, self.tok.lex.lineNum;
-					tv = self.tok.next();
-					if not tv.isstring():
-						raise SyntaxError, self.tok.lex.lineNum;
-					# insert string into the string table
-					self.bibtex.insertAbbrev(tn.val, strstrip(tv.val));
-					#print >> sys.stderr, "string", tn.val, tv.val
-					t = self.tok.next();
-					if not t.isdelimR():
-						raise SyntaxError, self.tok.lex.lineNum;
-				elif t.val.lower() == 'comment':
-					depth = 0;
-					while True:
-						tn = self.tok.next();
-						if t.isdelimL():
-							depth += 1;
-						if t.isdelimR():
-							depth -= 1;
-							if depth == 0:
-								break;
-				else:
-					# NOT A STRING or COMMENT ENTRY
-					# assume a normal reference type
-
-					# get the cite key
-					ck = self.tok.next();
-					if not ck.isstring():
-						raise SyntaxError, self.tok.lex.lineNum;
-
-					#print >> sys.stderr, t.val, ck.val
-					be = BibTeXEntry(ck.val, self.bibtex);
-					be.setType(t.val);
-
-					# get the comma
-					ck = self.tok.next();
-					if not ck.iscomma():
-						raise SyntaxError, self.tok.lex.lineNum;
-
-					# get the field value pairs
-					for tf in self.tok:
-						# allow for poor syntax with comma before
-						# end brace
-						if tf.isdelimR():
-							break;
-
-						if not tf.isstring():
-							raise SyntaxError, self.tok.lex.lineNum;
-						t = self.tok.next();
-						if not t.isequal():
-							raise SyntaxError, self.tok.lex.lineNum;
-						ts = self.tok.next();
-						if not ts.isstring():
-							raise SyntaxError, self.tok.lex.lineNum;
-						#print >> sys.stderr, "  ", tf.val, " := ", ts.val;
-						be.setField(tf.val, strstrip(ts.val));
-
-						# if it was an abbrev in the file, put it in the
-						# abbrevDict so it gets written as an abbrev
-						if ts.isabbrev():
-							self.bibtex.insertAbbrev(ts.val, None);
-							#print >> sys.stderr, "putting unresolved abbrev %s into dict" % ts.val;
-
-						t = self.tok.next();
-						if t.iscomma():
-							continue;
-						elif t.isdelimR():
-							break;
-						else:
-							raise SyntaxError, self.tok.lex.lineNum;
-
-
-					self.bibtex.insertEntry(be, ignore);
-				return;
-
-		bibparser = BibParser(s, self);
-		bibcount = 0;
+						be = self.makeEntry(op[1], op[2], op[3]);
+						self.keepText(be, piece, op[4], op[5]);
+						entries.append(be);
+			except AttributeError, err:
+				error = ('exception', err);
+			pieces.append( (tuple(entries), tuple(abbrevs)) );
+			if error:
+				return pieces, error;
+			line += s.count('\n', start, end);
+			start = end;
+		return pieces, None;
+
+	# update the bibliography from a file, see update
+	def updateFile(self, fileName, ignore=False):
+		fp = self.open(fileName);
 		try:
-			for be in bibparser:
-				bibcount += 1;
-				pass;
-		except SyntaxError, err:
-			print "Syntax error at line " + str(err);
+			return self.update(fp.read(), ignore);
+		finally:
+			self.close(fp);
+
+	# iterate over the entries in a list of files, or stdin if the list is
+	# empty.  With one job the files are streamed and the entries are not
+	# retained, otherwise the files are parsed in parallel by parseFiles.
+	def iterentries(self, fileNames, jobs=1):
+		if jobs > 1:
+			self.parseFiles(fileNames, jobs);
+			for be in self:
+				yield be;
+			return;
+		for f in (fileNames or [None]):
+			for be in self.iterparse(f, retain=False):
+				if not isinstance(be, tuple):
+					yield be;
+
+# an entry that just records the fields the parser sets, see BibRecorder
+class RecordedEntry:
+
+	def __init__(self, key, bib):
+		self.key = key;
+		self.fields = [];
+		self.span = None;
+
+	def getKey(self):
+		return self.key;
+
+	def setType(self, value):
+		self.reftype = value;
 
-		return bibcount;
+	def setField(self, field, value):
+		self.fields.append( (intern(field), value) );
+
+# a bibliography that records, in order, the abbreviations and entries the
+# parser inserts into it, so that they can be replayed into another
+# bibliography by BibTeX.replay
+class BibRecorder(BibTeX):
+
+	entryClass = RecordedEntry;
+
+	def __init__(self):
+		BibTeX.__init__(self);
+		self.ops = [];
+
+	def insertAbbrev(self, abbrev, value):
+		self.ops.append( ('abbrev', abbrev, value) );
+		return True;
+
+	def insertEntry(self, be, ignore=False):
+		self.ops.append( ('entry', be.reftype, be.key, be.fields) + be.span );
+		return True;
+
+	# the offsets of the text of an entry are always recorded
+	def keepText(self, be, s, start, end):
+		be.span = (start, end);
+
+	def reportSyntaxError(self, line):
+		self.ops.append( ('error', line) );
+
+# parse a file in a worker process for BibTeX.parseFiles, return the
+# filename, the recorded abbreviations and entries, and the text of the file
+# if it is to be kept.  The file is read once, for both.
+def parseWorker((fileName, verbatim)):
+	bib = BibRecorder();
+	fp = bib.open(fileName);
+	s = fp.read();
+	bib.parseText(fp, s);
+	bib.close(fp);
+	if not verbatim:
+		s = None;
+	return (bib.getFilename(), bib.ops, s);
+
+# parse a piece of a string in a worker process for BibTeX.parseSplit,
+# return the recorded abbreviations and entries
+def splitWorker((s, line, lexer)):
+	bib = BibRecorder();
+	for x in bib.parseItems(s, line, lexer=lexer):
+		pass;
+	return bib.ops;
+
+# time loading generated bibliographies of 1k to 1M entries, the time per
+# entry should not grow with the size.  An argument limits the largest size.
+if __name__ == "__main__":
+	import timeit;
+
+	def generate(n):
+		return ''.join(["@article{key%d,\n  author = {A. Author and B. Author},\n  title = {Title number %d},\n  journal = {Journal},\n  year = %d\n}\n" % (i, i, 1950 + i % 70) for i in xrange(n)]);
+
+	def insert(entries):
+		bib = BibTeX();
+		for be in entries:
+			bib.insertEntry(be);
+
+	def parse(s):
+		bib = BibTeX();
+		bib.parseString(s);
+
+	# the keys, titles, years and abbreviations of a bibliography, to
+	# compare one that has been updated with a fresh parse
+	def state(bib):
+		return ([(be.key, be.getTitle(), be.getYear()) for be in bib.keyList], sorted(bib.abbrevDict.items()));
+
+	# make random edits to a file with many duplicate keys, and check that
+	# update leaves the bibliography as a fresh parse would
+	def checkUpdate(seeds=20, edits=60):
+		import random;
+
+		def entry(r):
+			return "@misc{k%d, title={t%d}, year=%d}\n" % (r.randint(0, 15), r.randint(0, 999), 1990 + r.randint(0, 9));
+
+		# an entry that shadows a duplicate is deleted
+		s = "@misc{a,title={one}} @misc{b,title={two}} @misc{a,title={three}}";
+		bib = BibTeX();
+		bib.update(s, True);
+		bib.update(s.replace("@misc{a,title={one}} ", ""), True);
+		bad = [(be.key, be.getTitle()) for be in bib.keyList] != [('b', 'two'), ('a', 'three')];
+
+		for seed in range(seeds):
+			r = random.Random(seed);
+			items = [entry(r) for i in range(30)] + ['@string{s%d = "v"}\n' % i for i in range(2)];
+			r.shuffle(items);
+			bib = BibTeX();
+			bib.update(''.join(items), True);
+			for n in range(edits):
+				op = r.random();
+				i = r.randrange(len(items) + 1);
+				if op < 0.35 and i < len(items):
+					del items[i];
+				elif op < 0.7 or i == len(items):
+					items.insert(i, entry(r));
+				else:
+					items[i] = entry(r);
+				s = ''.join(items);
+				bib.update(s, True);
+				fresh = BibTeX();
+				fresh.update(s, True);
+				if state(bib) != state(fresh):
+					bad += 1;
+		print "%d edits, %d mismatches" % (seeds * edits + 1, bad);
+		return bad;
+
+	if sys.argv[1:2] == ['--update']:
+		sys.exit(checkUpdate() > 0);
+
+	largest = 1000000;
+	if len(sys.argv) > 1:
+		largest = int(sys.argv[1]);
+	print "%8s %16s %16s" % ("entries", "insertEntry", "parseString");
+	n = 1000;
+	while n <= largest:
+		maker = BibTeX();
+		entries = [maker.makeEntry('article', "key%d" % i, [('title', "Title number %d" % i)]) for i in xrange(n)];
+		s = generate(n);
+		tinsert = min(timeit.repeat(lambda: insert(entries), number=1, repeat=3)) / n;
+		tparse = min(timeit.repeat(lambda: parse(s), number=1, repeat=1)) / n;
+		print "%8d %13.2f us %13.1f us" % (n, tinsert * 1e6, tparse * 1e6);
+		n *= 10;
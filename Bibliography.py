@@ -32,39 +32,50 @@
 # THE POSSIBILITY OF SUCH DAMAGE.
 import string;
 import BibEntry;
+import BibIndex;
+import BibRemote;
+import BibCodec;
 import urllib;
 import urlparse;
 import os;
 import os.path;
 import sys;
 
-NoSuchFile = "No such file";
+class NoSuchFile(IOError):
+	pass;
+
+# the paths found by findFile, by BIBPATH and file name
+resolved = {};
 
 class Bibliography:
 
+	remote = BibRemote.fromEnvironment();	# copies of URLs, or None
+
 	def __init__(self):
-		self.keyList = [];
+		self.keyList = [];	# entries in order
+		self.keyDict = {};	# entries by key
 		self.abbrevDict = {}
+		self.textIndex = None;	# see buildIndex
+		self.dateIndex = None;	# see dateRange
 
+	# open a local file, a URL or stdin, decompressed if it is compressed,
+	# see BibCodec
 	def open(self, filename):
 		if filename == '-':
 			self.filename = "stdin";
-			return sys.stdin;
-		urlbits = urlparse.urlparse('~/lib/bib/z.bib');
-		if urlbits[0]:
+			return BibCodec.reader(sys.stdin);
+		urlbits = urlparse.urlparse(filename);
+		if urlbits[0] in ('http', 'https', 'ftp', 'file'):
 			# path is a URL
-			fp = urllib.urlopen(filename);
+			if self.remote and urlbits[0] in ('http', 'https'):
+				fp = self.remote.open(filename);
+			else:
+				fp = urllib.urlopen(filename);
 			self.filename = filename;
+			return BibCodec.reader(fp);
 		else:
 			# path is a local file
-			path = os.environ['BIBPATH'];
-			for p in string.split(path, os.pathsep):
-				f = os.path.join(p, filename);
-				if os.path.isfile(f):
-					break;
-			else:
-				raise NoSuchFile;
-
+			f = self.findFile(filename);
 			fp = open(f, "r");
 			home = os.path.expanduser('~');
 			f2 = os.path.abspath(f);
@@ -74,31 +85,55 @@ class Bibliography:
 			else:
 				self.filename = f;
 
-			return fp;
+			return BibCodec.reader(fp);
+
+	# return the path of a local file, looked for in the directories of
+	# BIBPATH, or the current directory if it is not set.  The path found is
+	# remembered, and only looked for again if it is no longer a file.
+	def findFile(self, filename):
+		path = os.environ.get('BIBPATH', os.curdir);
+		f = resolved.get( (path, filename) );
+		if f and os.path.isfile(f):
+			return f;
+		for p in string.split(path, os.pathsep):
+			f = os.path.join(p, filename);
+			if os.path.isfile(f):
+				resolved[(path, filename)] = f;
+				return f;
+		raise NoSuchFile, "%s not found in %s" % (filename, path);
 
 	def close(self, fp):
 		fp.close();
 
-	# resolve all abbreviations found in the value fields of all entries
-	def resolveAbbrev(self):
+	# resolve all abbreviations found in the value fields of all entries, or
+	# of a list of them
+	def resolveAbbrev(self, entries=None):
 		#print >> sys.stderr, len(self.abbrevDict);
-		for be in self:
+		if entries == None:
+			entries = self;
+		for be in entries:
 			for f in be:
 				v = be.getField(f);
 				if isinstance(v,str): 
 					if v in self.abbrevDict:
 						if self.abbrevDict[v]:
 							be.setField(f, self.abbrevDict[v]);
+		if self.textIndex != None:
+			self.buildIndex();
 
 	def insertEntry(self, be, ignore=False):
 		#print >> sys.stderr, "inserting key ", be.getKey()
 		# should check to see if be is of BibEntry type
 		key = be.getKey();
-		if key in [x.key for x in self.keyList]:
+		if key in self.keyDict:
 			if not ignore:
 				print >> sys.stderr, "key %s already in dictionary" % (key)
 			return False;
 		self.keyList.append(be);
+		self.keyDict[key] = be;
+		if self.textIndex != None:
+			self.textIndex.insert(be);
+		self.dateIndex = None;
 		return True;
 
 	def insertAbbrev(self, abbrev, value):
@@ -130,12 +165,14 @@ class Bibliography:
 			print >> sys.stderr
 
 	def __contains__(self, key):
-		return key in [x.key for x in self.keyList];
+		return key in self.keyDict;
 
 	def __getitem__(self, i):
 		if type(i) is str:
-			index = [x.key for x in self.keyList].index(i);
-			return self.keyList[index];
+			try:
+				return self.keyDict[i];
+			except KeyError:
+				raise ValueError, "key %s not in bibliography" % i;
 		elif type(i) is int:
 			return self.keyList[i];
 		else:
@@ -146,22 +183,54 @@ class Bibliography:
 
 
 	def sort(self, sortfunc):
-		# turn the dictionary of entries into a list so we can sort it
+		# sort the list of entries, the key index is not affected
 		self.keyList.sort(sortfunc);
+		if self.textIndex != None:
+			self.buildIndex();
+		self.dateIndex = None;
+
+	# index the words in the entries, so that search can answer plain word
+	# queries without looking at every entry, see BibIndex.TextIndex.  The
+	# index is kept up to date as entries are inserted, but must be built
+	# again if their fields are changed other than by resolveAbbrev.
+	def buildIndex(self):
+		self.textIndex = BibIndex.TextIndex();
+		for be in self:
+			self.textIndex.insert(be);
 
 
 	# return list of all bibentry's that match the search spec
 	def search(self, key, str, type="all", caseSens=0):
 		if str == '*':
-			return self.keyList;
+			if string.lower(type) == "all":
+				return self.keyList;
+			return [be for be in self if be.isRefType(type)];
+
+		if self.textIndex != None:
+			result = self.textIndex.search(key, str, caseSens);
+			if result != None:
+				if string.lower(type) != "all":
+					result = [be for be in result if be.isRefType(type)];
+				return result;
 		
 		result = [];
-		if string.lower(type) == "all":
-			for be in self:
-				if be.search(key, str, caseSens):
-					result.append(be);
-		else:
-			for be in self:
-				if be.isRefType(type) and be.search(key, str, caseSens):
-					result.append(be);
+		for be in self:
+			if self.matches(be, key, str, type, caseSens):
+				result.append(be);
 		return result;
+
+	# true if the bibentry matches the search spec, as for search()
+	def matches(self, be, key, str, type="all", caseSens=0):
+		if string.lower(type) != "all" and not be.isRefType(type):
+			return False;
+		if str == '*':
+			return True;
+		return be.search(key, str, caseSens);
+
+	# return the entries, in order, that are not before since and are
+	# before before, see BibEntry.afterDate and beforeDate.  The entries
+	# are kept sorted by date so that only those in the range are looked at.
+	def dateRange(self, since=None, before=None):
+		if self.dateIndex == None:
+			self.dateIndex = BibIndex.DateIndex(self);
+		return self.dateIndex.range(since, before);